@@ -6,22 +6,34 @@
 
 import argparse
 import asyncio
-import coloredlogs
+import atexit
+import collections
+import contextlib
+import ctypes
 import fractions
+import heapq
+import importlib.metadata
 import inspect
+import itertools
+import json
 import logging
-import mido
+import math
+import mmap
 import os
 import random
 import signal
+import struct
 import sys
 import threading
 import time
+import tracemalloc
+import wave
 
 from enum import Enum
 from os   import environ
 
-from music21 import *
+# for --startup-report, everything is measured from here
+STARTUP_T0      = time.perf_counter()
 
 # jump through various hoops
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
@@ -31,21 +43,93 @@ environ["COLOREDLOGS_DATE_FORMAT"]    = '%H:%M:%S'
 environ["COLOREDLOGS_LEVEL_STYLES"]   = 'info=144;warn=172;debug=32'
 environ["FLUIDSYNTH_GAIN"]            = "6.0"
 
-import pygame.midi
-
-# why not, import the world
+# why not, import the world... well, the cheap parts of it
 import mingus.core.notes  as notes
 import mingus.core.chords as chords
 
 from   mingus.core.notes  import reduce_accidentals
 from   mingus.core.chords import from_shorthand
-from   mingus.midi        import fluidsynth
 
 #
-# monkey madness time
+# the heavy stuff (music21, pygame, pyfluidsynth, mido) gets pulled in by the load_*()
+# functions below only once the options in play actually need it, so "-h", "-s help" and
+# friends don't pay for them
 #
-import mingus.midi.pyfluidsynth as pyfluid
-from   mingus.midi.pyfluidsynth import fluid_settings_setnum, fluid_settings_setint, fluid_settings_setstr
+pitch           = None
+scale           = None
+harmony         = None
+
+mido            = None
+
+pygame          = None
+pyfluid         = None
+
+fluid_settings_setnum = fluid_settings_setint = fluid_settings_setstr = None
+fluid_synth_get_active_voice_count = None
+
+startup_phases  = [("import", time.perf_counter() - STARTUP_T0)]
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """Time a chunk of startup for --startup-report"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases.append((name, time.perf_counter() - t0))
+
+def startup_report():
+    print("Startup report")
+    print("=" * 40)
+    for name, secs in startup_phases:
+        print(f"{name:25} | {secs * 1000:8.1f}ms")
+    print(f"{'first playable note':25} | {(time.perf_counter() - STARTUP_T0) * 1000:8.1f}ms (since launch)")
+
+def load_music21():
+    global pitch, scale, harmony
+
+    if pitch is not None:
+        return
+
+    with startup_phase("import music21"):
+        from music21 import pitch, scale, harmony
+
+def load_mido():
+    global mido
+
+    if mido is not None:
+        return
+
+    with startup_phase("import mido"):
+        import mido
+
+def load_synth_modules():
+    """
+    pyfluidsynth (via mingus) and pygame's midi... importing mingus.midi.pyfluidsynth is what
+    goes looking for the fluidsynth library, so it waits until we're really going to play
+    """
+    global pygame, pyfluid
+    global fluid_settings_setnum, fluid_settings_setint, fluid_settings_setstr
+    global fluid_synth_get_active_voice_count
+
+    if pyfluid is not None:
+        return
+
+    with startup_phase("import synth modules"):
+        import pygame.midi
+
+        #
+        # monkey madness time
+        #
+        import mingus.midi.pyfluidsynth as pyfluid
+        from   mingus.midi.pyfluidsynth import fluid_settings_setnum, fluid_settings_setint, fluid_settings_setstr
+
+        # mingus doesn't wrap this one... and older fluidsynths might not have it
+        try:
+            fluid_synth_get_active_voice_count = pyfluid.cfunc("fluid_synth_get_active_voice_count", ctypes.c_int,
+                                                               ("synth", ctypes.c_void_p, 1))
+        except AttributeError:
+            logging.debug("no fluid_synth_get_active_voice_count in this fluidsynth")
 
 
 ### the NMSVE lil midi box
@@ -56,9 +140,6 @@ from   mingus.midi.pyfluidsynth import fluid_settings_setnum, fluid_settings_set
 NMSVE           = "NMSVE "
 
 
-# it's a bit wobbly... but since this is essentially for a stepper function, don't do it for EVERY step
-KNOB_TOLERANCE  = 10
-
 # SF2 file?
 # SF2 = "/opt/homebrew/Cellar/fluid-synth/2.4.6/share/soundfonts/default.sf2"
 SF2 = "./GeneralUser-GS.sf2"
@@ -67,6 +148,8 @@ SF2 = "./GeneralUser-GS.sf2"
 # various keys in the scales
 #
 KEY_OFFSET      = 0  # Default is C == 0
+KEY_NAME        = "C"
+SCALE_NAME      = None  # -s, if it worked out
 
 # fire up the secret harmonizerooni?
 HARMONIZER      = False
@@ -76,6 +159,8 @@ ARP_SNOOZE      = 0.2
 ARP             = False
 ARP_BPM         = 120
 ARP_RATE        = fractions.Fraction(1, 4)  # Default is 1/4 notes per beat
+ARP_PHASE       = fractions.Fraction(0)     # how far into its first step a new arp waits, 0 is right away
+ARP_SYNC        = False                     # new arps wait for the next step on the shared beat grid (arp_grid)
 ARP_DIRECTION   = "up"
 ARP_OVERLAY     = False  # Renamed from ARP_LATCH
 ARP_LATCH       = False  # New option
@@ -87,17 +172,121 @@ MIDI_VELOCITY   = 127
 
 NOTES_IN_OCTAVE = 12
 
+# semitones up from C for the natural notes
+NOTE_LETTER_OFFSETS = { 'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11 }
+
 # until setup
 midi_player     = False
+synth           = None
+synth_sfid      = None
+
+# voice budget... at most MAX_VOICES notes held at once, past that one gets stolen, see play_note()
+MAX_VOICES      = 64
+STEAL_POLICY    = "oldest"
+STEAL_POLICIES  = ("oldest", "quietest", "same-note")
+VOICES_PER_NOTE = 8     # synth.polyphony is this many synth voices per note, for layered presets and release tails
+
+# sounding notes, oldest first: (channel, note) -> velocity
+voices       = collections.OrderedDict()
+voice_counts = {'started': 0, 'stopped': 0, 'stolen': 0, 'peak': 0}
 
-# Arpeggiator state
+# for --render... fluidsynth's default sample rate, and how much to render at a go
+RENDER_SAMPLE_RATE = 44100
+RENDER_BLOCK       = 4096
+RENDER_TAIL        = 2.0   # seconds of ring out after the last note
+
+# Arpeggiator state... only ever touched from the event loop (see run_live()), so no lock
 active_arps     = {}
-arp_lock        = threading.Lock()
-arp_loop        = None
+
+# ARP_PATTERN parsed, and compiled into arp_steps[direction][base note] -> notes (None is a rest)
+arp_pattern     = []
+arp_steps       = { 1: [], -1: [] }
+
+# the arps by when their next step's due: (due, seq, note id), see schedule_arp()... an arp that's
+# gone or been rescheduled leaves its old entry behind, skipped (by seq) when it gets to the top
+arp_heap        = []
+arp_seq         = itertools.count()
+arp_time        = time.monotonic    # the arps' clock (the event loop's), --bench and --render bring their own
+arp_wakeup      = None              # set to get the arp loop to look at the heap again, see run_live()
+
+# how the arp clock is keeping up, see record_arp_tick()
+arp_clock       = { 'ticks': 0, 'skipped': 0, 'late_sum': 0.0, 'late_max': 0.0, 'started': None, 'last_tick': None,
+                    'beats': 0.0, 'beat_time': 0.0 }
+arp_lateness    = collections.deque(maxlen=10000)
+
+# --arp-sync's beat grid: how many beats in it was at time, at bpm... kept counting through BPM
+# changes (see anchor_arp_grid()), and started over at 0 by the first arp when none are going
+arp_grid        = { 'time': None, 'beats': 0.0, 'bpm': None }
 
 # Only play notes in the scale
 ONLY_SCALE_PERMITTED = False
 
+# all sound off, all notes off
+PANIC_CONTROLS  = (120, 123)
+
+# between the inputs and the sound engine, see EventQueue... a queue per input, one engine
+# task draining the lot, woken by the one event (these are made when the event loop starts)
+ENGINE_QUEUE_SIZE = 256
+engine_loop     = None
+engine_wakeup   = None
+controls_wakeup = None
+
+# what we're listening to (--input), each with its own synth channel, instrument and queue, see make_input()
+inputs          = []
+
+# synth channels for the inputs, in order... 1 was always ours, and 9 is the drums
+INPUT_CHANNELS  = [c for c in range(1, 16) if c != 9]
+
+# --presets: slots of programs, each program on its own synth channel, selected and warmed up at
+# startup... switching is just pointing an input at a different slot, see select_preset()
+preset_slots    = []            # slot -> synth channels it plays on (more than one and they're layered)
+channel_layers  = {}            # input channel -> synth channels its current preset plays on (itself if it isn't here)
+channel_gain    = {}            # input channel -> the volume (CC 7) its knob last asked for, see apply_gain()
+PRESET_PAD      = None          # held down, the next pad picks a preset instead of playing (--preset-pad)
+preset_pad_held = set()         # input channels with the preset pad down
+WARM_KEYS       = (36, 60, 84)  # notes to warm each program up with, low to high for the different sample zones
+
+# hot-plug... how often to check on attached inputs, and the backoff when looking for missing ones
+WATCH_INTERVAL  = 1.0
+WATCH_BACKOFF   = (0.25, 5.0)
+
+# input to sound latency numbers (None unless --latency-report), see LatencyStats
+latency         = None
+
+# --record'ing the session? See SessionRecorder
+recorder        = None
+
+# after a --replay, how long to let things ring before shutting down
+REPLAY_TAIL     = 2.0
+
+# hot path event log (None when nobody's going to look at it), see EventLog
+event_log       = None
+
+# --profile'ing? See Profiler
+profiler         = None
+PROFILE_INTERVAL = 0.002
+
+# what each controller number does (see CC_HANDLERS), and how often they're actually applied...
+# a knob sweep sends dozens of values, the synth only needs to hear the latest one every CC_INTERVAL
+CC_MAP          = {7: "gain"}
+CC_INTERVAL     = 0.02
+OCTAVE_RANGE    = 2             # the octave control shifts up to this many octaves down or up
+ARP_BPM_RANGE   = (40, 300)     # and the arp BPM control sweeps between these
+
+OCTAVE_SHIFT    = 0
+
+cc_pending      = {}            # (channel, controller) -> latest value, not applied yet
+cc_applied      = {}            # (channel, controller) -> value last applied
+cc_next_due     = 0.0
+cc_unmapped     = set()         # controllers we've already grumbled about
+cc_counts       = {'coalesced': 0, 'applied': 0}
+
+# everything the engine's handled, by message type (for --metrics-port)
+message_counts  = collections.Counter()
+
+# --control-socket... how many table rows get built at a time before the inputs get a look in
+CONTROL_SLICE   = 8
+
 # Predefined patterns
 PREDEFINED_PATTERNS = {
     "increment": "+1.+2.+3.+4.",
@@ -107,11 +296,48 @@ PREDEFINED_PATTERNS = {
     "down-up":   "+0.-1.-2.-3.-2.-1.+0."
 }
 
+# other names folks know some of the music21 scales by
+SCALE_ALIASES = {
+    "natural minor":    "minor",
+    "aeolian":          "minor",
+    "ionian":           "major",
+    "major pentatonic": "pentatonic",
+}
+
+# stuff we'd rather not recompute on every launch lives here
+CACHE_DIR = os.path.join(environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "noize")
+
+# scale name -> pitch classes, notes, etc., see load_scale_catalog()
+scale_catalog = None
+
+# SF2 path -> [(bank, program, name)], see load_sf2_index()
+sf2_indexes   = {}
+
+# bits of an SF2 (RIFF) file... chunk headers, and the 38 byte preset headers in pdta/phdr
+SF2_CHUNK     = struct.Struct('<4sI')
+SF2_PHDR      = struct.Struct('<20sHH14x')     # name, program, bank (then bag index, library, genre, morphology)
+
 # Current scale (if any)
 current_scale = None
 current_scale_obj = None
 scale_notes_midi = None
 
+# ... and compiled into lookup tables, see compile_scale_tables()
+scale_pcs         = tuple(range(12))        # pitch classes in the scale, in order
+scale_mask        = 0xfff                   # bit n is set if pitch class n is in the scale
+scale_pc_nearest  = list(range(12))         # pitch class -> nearest one in the scale
+scale_pc_position = list(range(12))         # pitch class -> where it is in the scale, -1 if it isn't
+scale_nearest     = list(range(128))        # midi note -> nearest note in the scale
+scale_position    = list(range(128))        # midi note -> position in the scale, across octaves
+scale_degree_midi = list(range(132))        # position in the scale -> midi note
+scale_key_map     = list(range(128))        # key -> scale note, for --only-scale-permitted
+
+# sounding notes for each trigger note in chord mode, see build_chord_table()
+chord_table = []
+
+# what each held key is actually sounding: (channel, trigger note) -> (synth channel, note) pairs, see start_sound()
+active_voices = {}
+
 class ArpDirection(Enum):
     UP      = "up"
     DOWN    = "down"
@@ -119,6 +345,8 @@ class ArpDirection(Enum):
 
 def get_all_music21_scales():
     """Dynamically discover all concrete scale classes in music21"""
+    load_music21()
+
     scale_classes = {}
 
     # Classes to exclude - these are abstract bases or utilities, not playable scales
@@ -180,36 +408,30 @@ def get_all_music21_scales():
     # Only add aliases for scales that actually exist and work
     aliases = {}
 
-    # Check what actually exists and add safe aliases
-    if 'minor' in scale_classes:
-        aliases['natural minor'] = scale_classes['minor']
-        aliases['aeolian'] = scale_classes['minor']
-
-    if 'major' in scale_classes:
-        aliases['ionian'] = scale_classes['major']
-
-    # Check for pentatonic variations
-    if 'pentatonic' in scale_classes:
-        aliases['major pentatonic'] = scale_classes['pentatonic']
+    for alias, scale_name in SCALE_ALIASES.items():
+        if scale_name in scale_classes:
+            aliases[alias] = scale_classes[scale_name]
 
     scale_classes.update(aliases)
     return scale_classes
 
-def list_all_scales():
-    """List all available scales with examples"""
-    available_scales = get_all_music21_scales()
+def build_scale_catalog():
+    """Scan music21 for scales and boil them down to plain data (names, pitch classes, notes in C)"""
+    catalog = {}
+    classes = get_all_music21_scales()
 
-    print("All available scales in music21 - example notes presume the key of C")
-    print("=" * 60)
+    for scale_name, scale_class in classes.items():
+        entry = { 'class': scale_class.__name__ }
 
-    successful_scales = []
-    failed_scales = []
+        if scale_name in SCALE_ALIASES:
+            entry['alias_of'] = SCALE_ALIASES[scale_name]
 
-    for scale_name in sorted(available_scales.keys()):
         try:
             # Try to create an example in C
-            example_scale = available_scales[scale_name](pitch.Pitch('C'))
+            example_scale = scale_class(pitch.Pitch('C'))
+
             notes = []
+            pitch_classes = []
 
             # Get the pitches and format them nicely
             for p in example_scale.pitches:
@@ -218,10 +440,82 @@ def list_all_scales():
                 note_name = note_name.replace('♭', 'b').replace('♯', '#').replace('-','b')
                 notes.append(note_name)
 
-            successful_scales.append((scale_name, notes))
+                if p.midi % 12 not in pitch_classes:
+                    pitch_classes.append(p.midi % 12)
+
+            entry['notes']         = notes
+            entry['pitch_classes'] = pitch_classes
 
         except Exception as e:
-            failed_scales.append((scale_name, str(e)))
+            entry['error'] = str(e)
+
+        catalog[scale_name] = entry
+
+    return catalog
+
+def scale_catalog_path():
+    """The on-disk catalog is keyed by music21 version, since the set of scales changes with it"""
+    try:
+        # (music21 has its own "metadata" module, hence the long way 'round)
+        version = importlib.metadata.version('music21')
+    except importlib.metadata.PackageNotFoundError:
+        version = "unknown"
+
+    return os.path.join(CACHE_DIR, f"scales-music21-{version}.json"), version
+
+def load_scale_catalog():
+    """Get the scale catalog from the cache if we can, otherwise scan music21 and cache the results"""
+    global scale_catalog
+
+    if scale_catalog is not None:
+        return scale_catalog
+
+    cache_file, version = scale_catalog_path()
+
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+
+        if cached.get('music21') == version:
+            logging.debug(f"read scale catalog from {cache_file}")
+            scale_catalog = cached['scales']
+            return scale_catalog
+
+    except (OSError, ValueError, KeyError) as e:
+        logging.debug(f"no usable scale catalog at {cache_file} ({e}), rebuilding")
+
+    scale_catalog = build_scale_catalog()
+
+    # write it out atomically-ish, a failure here just means we scan again next time
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}"
+        with open(tmp_file, 'w') as f:
+            json.dump({ 'music21': version, 'scales': scale_catalog }, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, cache_file)
+        logging.debug(f"wrote scale catalog to {cache_file}")
+    except OSError as e:
+        logging.warning(f"couldn't cache scale catalog in {cache_file}: {e}")
+
+    return scale_catalog
+
+def list_all_scales():
+    """List all available scales with examples"""
+    available_scales = load_scale_catalog()
+
+    print("All available scales in music21 - example notes presume the key of C")
+    print("=" * 60)
+
+    successful_scales = []
+    failed_scales = []
+
+    for scale_name in sorted(available_scales.keys()):
+        entry = available_scales[scale_name]
+
+        if 'error' in entry:
+            failed_scales.append((scale_name, entry['error']))
+        else:
+            successful_scales.append((scale_name, entry['notes']))
 
     # Print successful scales
     for scale_name, notes in successful_scales:
@@ -256,6 +550,7 @@ def parse_fraction(fraction_str):
             return fractions.Fraction(1, 2)
 
 def setup_logging(log_level):
+    import coloredlogs
 
     # Map log level string to numeric value
     level_map = {
@@ -280,22 +575,20 @@ def setup_logging(log_level):
 
     return log_level
 
-def setup_instrument(instrument_int, instrument_str):
+def setup_instrument(instrument_int, instrument_str, channel=1, bank=0):
     global current_instrument
     
-    # num can't be any greater than the # of instruments
-    if 0 <= instrument_int < len(INSTRUMENTS):
-        logging.warning(f"Using instrument: {instrument_str} (#{instrument_int}) from {SF2}")
+    # num can't be any greater than the # of programs
+    if 0 <= instrument_int < 128:
+        logging.warning(f"Using instrument: {instrument_str} (#{bank}:{instrument_int}) from {SF2} on channel {channel}")
 
         # channel, instrument, bank
-        fluidsynth.set_instrument(1, instrument_int, 0)
+        set_instrument(channel, instrument_int, bank)
         current_instrument = instrument_int
         return True
     
     # If we get here, instrument wasn't found
-    logging.error(f"Instrument '{instrument_arg}' not found. Available instruments:")
-    for i, name in enumerate(INSTRUMENTS):
-        logging.error(f"{i}: {name}")
+    logging.error(f"Instrument '{instrument_int}' not found, see --list-instruments")
     return False
 
 # calculate semitone offset from C
@@ -307,6 +600,14 @@ def calculate_key_offset(key_str):
     # Handle lowercase input and normalize
     key_str = key_str[0].upper() + key_str[1:]
 
+    # plain old note names (C, F#, Bb, E-) are easy enough to do without waking up music21
+    if key_str[0] in NOTE_LETTER_OFFSETS and all(c in '#b-' for c in key_str[1:]):
+        offset = NOTE_LETTER_OFFSETS[key_str[0]] + key_str.count('#') - key_str.count('b') - key_str.count('-')
+        logging.info(f"Transposing from C to {key_str} (offset: {offset} semitones)")
+        return offset
+
+    load_music21()
+
     # Create a pitch object for the key and for C
     try:
         key_pitch = pitch.Pitch(key_str)
@@ -327,6 +628,8 @@ def transpose_note(note_str, semitones):
     if not note_str:
         return note_str
     
+    load_music21()
+
     # Parse the note
     try:
         # Create a pitch object
@@ -343,6 +646,8 @@ def transpose_note(note_str, semitones):
 
 def create_scale(key_name, scale_type):
     """Create a scale object based on key and scale type"""
+    load_music21()
+
     try:
         # Normalize the key name
         key_pitch = pitch.Pitch(key_name.title())
@@ -351,8 +656,8 @@ def create_scale(key_name, scale_type):
 
     scale_type_lower = scale_type.lower()
 
-    # Get all available scales
-    available_scales = get_all_music21_scales()
+    # Get all available scales (from the cached catalog, no need to rummage through music21)
+    available_scales = load_scale_catalog()
 
     # Check if it's a custom scale format (note-note-note)
     if '-' in scale_type_lower:
@@ -371,12 +676,12 @@ def create_scale(key_name, scale_type):
     
     # Try exact match first
     if scale_type_lower in available_scales:
-        scale_class = available_scales[scale_type_lower]
+        scale_entry = available_scales[scale_type_lower]
     else:
         # Try partial matching
-        matches = [name for name in available_scales.keys() if scale_type_lower in name]
+        matches = match_scale_names(scale_type_lower)
         if len(matches) == 1:
-            scale_class = available_scales[matches[0]]
+            scale_entry = available_scales[matches[0]]
             print(f"Note: Using '{matches[0]}' for '{scale_type}'")
         elif len(matches) > 1:
             print(f"Ambiguous scale type: '{scale_type}'. Could be:")
@@ -392,11 +697,22 @@ def create_scale(key_name, scale_type):
 
     # Create the scale
     try:
+        scale_class   = getattr(scale, scale_entry['class'])
         created_scale = scale_class(key_pitch)
         return created_scale
     except Exception as e:
         raise ValueError(f"Error creating {scale_type} scale in key {key_name}: {e}")
 
+def match_scale_names(scale_type):
+    """The catalog's scale called scale_type, or if there isn't one, all the ones with it in their name"""
+    available_scales = load_scale_catalog()
+    scale_type       = scale_type.lower()
+
+    if scale_type in available_scales:
+        return [scale_type]
+
+    return [name for name in available_scales if scale_type in name]
+
 def setup_scale(scale_arg, key_str='C'):
     global current_scale, current_scale_obj, scale_notes_midi
     
@@ -411,7 +727,21 @@ def setup_scale(scale_arg, key_str='C'):
     if not scale_arg:
         logging.warning(f"No scale specified, returning None")
         return None
-    
+
+    made = make_scale(scale_arg, key_str)
+    if made is None:
+        return None
+
+    current_scale, current_scale_obj, scale_notes_midi = made
+
+    compile_scale_tables()
+
+    return current_scale
+
+def make_scale(scale_arg, key_str='C'):
+    """The notes, music21 scale and pitch classes for a scale in a key, or None if it can't be made"""
+    load_music21()
+
     try:
         # For custom scales with the note-note-note format
         if '-' in scale_arg:
@@ -446,11 +776,7 @@ def setup_scale(scale_arg, key_str='C'):
             logging.info(f"Using custom scale: {key_str} {scale_arg} ({' '.join(note_names)})")
             logging.debug(f"Scale MIDI notes: {midi_notes}")
             
-            current_scale = note_names
-            current_scale_obj = scale_obj
-            scale_notes_midi = midi_notes
-            
-            return note_names
+            return note_names, scale_obj, midi_notes
         
         # For music21 scales
         else:
@@ -477,225 +803,247 @@ def setup_scale(scale_arg, key_str='C'):
             logging.info(f"Using scale: {key_str} {scale_arg} ({' '.join(note_names)})")
             logging.debug(f"Scale MIDI notes: {midi_notes}")
             
-            current_scale = note_names
-            current_scale_obj = scale_obj
-            scale_notes_midi = midi_notes
-            
-            return note_names
+            return note_names, scale_obj, midi_notes
         
     except Exception as e:
         logging.error(f"Error setting up scale: {e}")
         return None
 
 
+def compile_scale_tables():
+    """
+    Boil scale_notes_midi down to lookup tables, so each of the mapping functions below is an
+    index rather than a search... a few hundred list entries, cheap enough to redo on a key or
+    scale change. With no scale everything maps to itself.
+    """
+    t0 = time.perf_counter()
+
+    # all in one go, so nobody sees half of an old scale and half of a new one
+    globals().update(scale_tables(scale_notes_midi))
+
+    logging.debug(f"Scale tables for {scale_pcs} compiled in {(time.perf_counter() - t0) * 1000:.2f}ms")
+
+def scale_tables(scale_pitches):
+    """The tables for a scale (pitch classes, in order), as {global name: table}, see compile_scale_tables()"""
+    pcs    = tuple(scale_pitches or range(NOTES_IN_OCTAVE))
+    length = len(pcs)
+
+    mask = 0
+    for pc in pcs:
+        mask |= 1 << pc
+
+    # per pitch class... where it is in the scale (-1 if it isn't), and the nearest one that is,
+    # wrapping around the octave (ties go to whichever comes first in the scale)
+    pc_position = [pcs.index(pc) if mask >> pc & 1 else -1 for pc in range(12)]
+    pc_nearest  = [pc if mask >> pc & 1 else min(pcs, key=lambda s: min(abs(pc - s), 12 - abs(pc - s))) for pc in range(12)]
+
+    # and for every midi note
+    nearest  = [n // 12 * 12 + pc_nearest[n % 12] for n in range(128)]
+    position = [n // 12 * length + pc_position[n % 12] if pc_position[n % 12] >= 0 else nearest[n] for n in range(128)]
+    degree   = [p // length * 12 + pcs[p % length] for p in range(11 * length)]
+
+    # --only-scale-permitted's keys play the scale's notes one after the other, starting from octave 3 (C3 = 36)
+    key_map  = [max(0, min(127, (3 + (k - 36) // length) * 12 + pcs[k % length])) for k in range(128)]
+
+    return {
+        'scale_pcs':         pcs,
+        'scale_mask':        mask,
+        'scale_pc_nearest':  pc_nearest,
+        'scale_pc_position': pc_position,
+        'scale_nearest':     nearest,
+        'scale_position':    position,
+        'scale_degree_midi': degree,
+        'scale_key_map':     key_map,
+    }
+
 def is_note_in_scale(midi_note):
-    """Check if a MIDI note is in the current scale"""
-    if not scale_notes_midi:
-        return True  # If no scale is set, all notes are allowed
-    
-    # Check if the note (modulo 12 for octave independence) is in our scale
-    return (midi_note % 12) in scale_notes_midi
+    """Check if a MIDI note is in the current scale (with no scale, they all are)"""
+    return bool(scale_mask >> (midi_note % 12) & 1)
 
 def map_to_scale(midi_note):
     """Map a MIDI note to the nearest note in the scale"""
-    if not scale_notes_midi or not ONLY_SCALE_PERMITTED:
+    if not ONLY_SCALE_PERMITTED:
         return midi_note  # If no scale restriction, return the original note
-    
-    # If the note is already in the scale, return it
-    if is_note_in_scale(midi_note):
-        return midi_note
-    
-    # Find the octave and note within octave
-    octave = midi_note // 12
-    note_in_octave = midi_note % 12
-    
-    # Find the closest note in the scale
-    closest_note = None
-    min_distance = float('inf')
-    
-    for scale_note in scale_notes_midi:
-        distance = abs(note_in_octave - scale_note)
-        # Consider wrapping around the octave
-        wrapped_distance = min(distance, 12 - distance)
-        
-        if wrapped_distance < min_distance:
-            min_distance = wrapped_distance
-            closest_note = scale_note
-    
-    # Construct the mapped MIDI note
-    mapped_note = (octave * 12) + closest_note
-    
-    logging.debug(f"Mapped MIDI note {midi_note} to {mapped_note} (nearest in scale)")
-    return mapped_note
+
+    if 0 <= midi_note < 128:
+        return scale_nearest[midi_note]
+
+    # off the ends of the table... the same thing, the long way 'round
+    return midi_note // 12 * 12 + scale_pc_nearest[midi_note % 12]
 
 def get_scale_position(midi_note):
     """Get the position of a note in the scale (for scale-restricted mode)"""
-    if not scale_notes_midi or not ONLY_SCALE_PERMITTED:
+    if not ONLY_SCALE_PERMITTED:
         return midi_note  # Default behavior if no scale restriction
-    
-    # Get the note within the octave
-    note_in_octave = midi_note % 12
-    
-    # If the note is in the scale, find its position
-    if note_in_octave in scale_notes_midi:
-        position = scale_notes_midi.index(note_in_octave)
-        octave = midi_note // 12
-        
-        # Calculate the actual note in the scale across octaves
-        scale_note = position + (octave * len(scale_notes_midi))
-        return scale_note
-    else:
-        # If not in scale, map to the nearest note
+
+    if 0 <= midi_note < 128:
+        return scale_position[midi_note]
+
+    # If not in scale, map to the nearest note
+    position = scale_pc_position[midi_note % 12]
+    if position < 0:
         return map_to_scale(midi_note)
 
+    return midi_note // 12 * len(scale_pcs) + position
+
 def get_midi_from_scale_position(position):
     """Convert a scale position to a MIDI note number"""
-    if not scale_notes_midi or not ONLY_SCALE_PERMITTED:
+    if not ONLY_SCALE_PERMITTED:
         return position  # Default behavior if no scale restriction
-    
-    # Calculate octave and position within scale
-    octave = position // len(scale_notes_midi)
-    pos_in_scale = position % len(scale_notes_midi)
-    
-    # Get the note from the scale
-    note_in_octave = scale_notes_midi[pos_in_scale]
-    
-    # Calculate the MIDI note number
-    midi_note = (octave * 12) + note_in_octave
-    
-    return midi_note
+
+    if 0 <= position < len(scale_degree_midi):
+        return scale_degree_midi[position]
+
+    return position // len(scale_pcs) * 12 + scale_pcs[position % len(scale_pcs)]
 
 def map_midi_key_to_scale(midi_key):
     """
     Map a MIDI key number to a note in the scale sequentially.
     Each key plays the next note in the scale.
     """
-    if not scale_notes_midi or not ONLY_SCALE_PERMITTED:
+    if not ONLY_SCALE_PERMITTED or not scale_notes_midi:
         return midi_key  # If no scale restriction, return the original note
-    
-    # Get the scale length
-    scale_length = len(scale_notes_midi)
-    logging.debug(f"Scale length: {scale_length}, Scale notes: {scale_notes_midi}")
-    
-    # Calculate which note in the scale (0 to scale_length-1)
-    scale_index = midi_key % scale_length
-    
-    # Get the pitch class for this scale index
-    pitch_class = scale_notes_midi[scale_index]
-    
-    # Calculate the octave
-    base_octave = 3  # Start at octave 3 (C3 = 36)
-    octave_offset = (midi_key - 36) // scale_length
-    octave = base_octave + octave_offset
-    
-    # Calculate the final MIDI note
-    midi_note = (octave * 12) + pitch_class
-    
-    # Ensure we're in the valid MIDI range
-    midi_note = max(0, min(127, midi_note))
-    
-    logging.debug(f"Mapped MIDI key {midi_key} to scale note {midi_note} (scale index {scale_index}, octave {octave})")
-    return midi_note
 
-def start_sound(chan, note):
+    if 0 <= midi_key < 128:
+        return scale_key_map[midi_key]
+
+    length = len(scale_pcs)
+    return max(0, min(127, (3 + (midi_key - 36) // length) * 12 + scale_pcs[midi_key % length]))
+
+def voice_chord(note):
+    """Work out the MIDI notes that sound for a chord rooted on (an already scale-mapped) note"""
+    note_str, octave = number_to_note(note)
+
+    # For chords, we need to transpose the root note before getting the chord
+    if KEY_OFFSET != 0:
+        transposed_note_str = transpose_note(note_str, KEY_OFFSET)
+        logging.debug(f"Transposed chord root from {note_str} to {transposed_note_str}")
+        note_str            = transposed_note_str
+
+    notez     = chords.from_shorthand(note_str)
+    voicing   = []
+    last_note = 0
+
+    for nz in notez:
+        z = note_to_number(nz, octave)
+
+        if last_note > z:
+            z = z + NOTES_IN_OCTAVE
+
+        # If scale restriction is enabled, map chord notes to the scale
+        if ONLY_SCALE_PERMITTED:
+            z = map_to_scale(z)
+
+        voicing.append(z)
+
+        last_note = note
+
+    return tuple(voicing)
+
+def build_chord_table():
+    """
+    Voice a chord for every possible trigger note, so pressing and releasing a pad is
+    just a lookup. Needs to be rebuilt whenever the key or scale changes.
+    """
+    global chord_table
+
+    t0          = time.perf_counter()
+    chord_table = list(chord_rows())
+
+    logging.info(f"Chord table built in {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+def chord_rows():
+    """The chord table a row (trigger note) at a time, see build_chord_table() and reconfigure()"""
+    for trigger in range(128):
+        # If scale restriction is enabled, the key maps to the scale sequentially first
+        note = map_midi_key_to_scale(trigger) if ONLY_SCALE_PERMITTED else trigger
+
+        try:
+            yield voice_chord(note)
+        except Exception as e:
+            # out of range or something mingus can't voice... stays silent, like it always should have
+            logging.debug(f"No chord for MIDI key {trigger}: {e}")
+            yield ()
+
+def start_sound(chan, note, velocity=100):
     global midi_player
 
-    logging.warning("starting note.... ")
-    
+    if event_log:
+        event_log.log(EV_NOTE_ON, chan, note)
+
+    trigger = note
+
+    # which synth channel(s) the input's current preset plays on, see select_preset()
+    layers  = channel_layers.get(chan) or (chan,)
+
     # If scale restriction is enabled, map the key to the scale sequentially
     if ONLY_SCALE_PERMITTED:
-        original_note = note
         note = map_midi_key_to_scale(note)
-        if original_note != note:
-            logging.debug(f"Mapped key {original_note} to scale note {note}")
-    
-    note_str, octave = number_to_note(note)
-
-    _note, _octave = number_to_note(note)
+        if trigger != note:
+            logging.debug("Mapped key %s to scale note %s", trigger, note)
 
     # arpity, anyone?
     if ARP:
         # Start arpeggiator for this note
         logging.debug("starting the arp engine up!")
-        start_arp(chan, note)
+        start_arp(chan, note, trigger, velocity)
+
+        if latency:
+            latency.mapped("arp")
 
     # else chords, chords, and more chords
     elif CHORDS:
-        # For chords, we need to transpose the root note before getting the chord
-        if KEY_OFFSET != 0:
-            # Get the transposed root note
-            logging.debug(f"before transpose -> {note_str}")
-            transposed_note_str = transpose_note(note_str, KEY_OFFSET)
-            logging.debug(f"Transposed chord root from {note_str} to {transposed_note_str}")
-            note_str            = transposed_note_str
-            notez               = chords.from_shorthand(transposed_note_str)
-
-            # -> Mapped key 48 to scale note 66
-            # -> Transposed chord root from F to F
+        notez = chord_table[trigger] if 0 <= trigger < len(chord_table) else ()
 
-            print(f"KO: {KEY_OFFSET}")
-            # _n_ = note.Note(note_str)
-            # Access the .pitch.midi attribute to get the MIDI note number
-            # _m_n_ = n.pitch.midi
+        # up or down an octave or two, courtesy of the octave control
+        if OCTAVE_SHIFT:
+            notez = tuple(z + OCTAVE_SHIFT * NOTES_IN_OCTAVE for z in notez)
 
-            # print(
+        if latency:
+            latency.mapped("chords")
 
-            # midi_note_number = 60  # Middle C
-            # Create a Pitch object from the MIDI note number
-            # p = pitch.Pitch()
-            # p.midi = midi_note_number
-            # Get the note name with octave
-            # note_name = p.nameWithOctave
+        logging.debug("\t+++> [ch-%s / %s] %s", chan, trigger, notez)
 
+        # every note on each of the preset's layers (usually just the one)
+        voicez = tuple((c, z) for z in notez for c in layers)
 
+        for c, z in voicez:
+            play_note(z, c, velocity)
 
+        remember_voices(chan, trigger, voicez)
 
-        else:
-            notez = chords.from_shorthand(note_str)
+        if latency:
+            latency.played("chords", trigger)
 
-#       print(f"NS: {note_str}")
-#       note_str = note_str.replace('♭', 'b').replace('♯', '#').replace('-','b')
-#       print(f"NS: {note_str}")
+    # the purity of a single note....
+    else:
+        # Apply key transposition for direct note playing
+        transposed_note = note + KEY_OFFSET + OCTAVE_SHIFT * NOTES_IN_OCTAVE
 
-        logging.warning(f"{note_str} {notez}")
+        if latency:
+            latency.mapped("notes")
 
-        last_note = 0
+        logging.debug("\t+++> [ch-%s / %s] ... (Transposed %s)", chan, transposed_note, note)
 
-        logging.debug(f"\t+++> {note_str} [ch-{chan} / {notez}-{octave}]")
+        voicez = tuple((c, transposed_note) for c in layers)
 
-        for nz in notez:
-            z = note_to_number(nz, _octave)
-    
-            if last_note > z:
-                z = z + NOTES_IN_OCTAVE
-            
-            # If scale restriction is enabled, map chord notes to the scale
-            if ONLY_SCALE_PERMITTED:
-                original_z = z
-                z = map_to_scale(z)
-                if original_z != z:
-                    logging.debug(f"Mapped chord note {original_z} to {z} (in scale)")
-    
-            fluidsynth.play_Note(z)
-    
-            last_note = note
+        for c, z in voicez:
+            play_note(z, c, velocity)
 
-    # the purity of a single note....
-    else:
-        # Apply key transposition for direct note playing
-        if KEY_OFFSET != 0:
-            transposed_note = note + KEY_OFFSET
+        remember_voices(chan, trigger, voicez)
 
-            orig_note = note_str
+        if latency:
+            latency.played("notes", trigger)
 
-            note_str, octave = number_to_note(transposed_note)
+def remember_voices(chan, trigger, voicez):
+    """Note down what a key press is sounding, so the release doesn't have to work it out again"""
+    held = active_voices.get((chan, trigger))
 
-            logging.debug(f"\t+++> [ch-{chan} / {note_str}-{octave}] ... (Transposed {orig_note})")
+    # pressed again without a release in between... the first lot is still ringing
+    if held and held != voicez:
+        voicez = held + tuple(v for v in voicez if v not in held)
 
-            fluidsynth.play_Note(transposed_note)
-        else:
-            logging.debug(f"\t+++> [ch-{chan} / {note_str}-{octave}]")
-            fluidsynth.play_Note(note)
+    active_voices[(chan, trigger)] = voicez
 
 # heads or tails... for random arp, up or down
 def flip():
@@ -720,27 +1068,9 @@ def parse_arp_pattern(pattern_arg):
 
 def get_note_from_scale(base_note, offset):
     if ONLY_SCALE_PERMITTED and scale_notes_midi:
-        # In scale-restricted mode, we need to work with scale positions
-        scale_length = len(scale_notes_midi)
-        
-        # Find the position of this note in our sequential mapping
-        base_position = base_note % scale_length
-        
-        # Apply the offset within the scale
-        new_position = (base_position + offset) % scale_length
-        octave_change = (base_position + offset) // scale_length
-        
-        # Calculate the new octave
-        base_octave = base_note // scale_length
-        new_octave = base_octave + octave_change
-        
-        # Get the note from the scale
-        note_in_octave = scale_notes_midi[new_position]
-        
-        # Calculate the MIDI note number
-        midi_note = (new_octave * 12) + note_in_octave
-        
-        return midi_note
+        # In scale-restricted mode, we work with scale positions... the base note is one already
+        # (in the sequential mapping), so the offset just moves along the scale from there
+        return get_midi_from_scale_position(base_note + offset)
     elif current_scale:
         # Original scale-based logic for non-restricted mode
         # Extract the base note letter and octave
@@ -778,142 +1108,305 @@ def get_note_from_scale(base_note, offset):
         return base_note + offset
 
 
-def get_arp_sequence_notes(base_note, pattern):
+def get_arp_sequence_notes(steps):
     """Get the actual notes that will be played in the arpeggio sequence"""
     sequence = []
-    for element in pattern:
-        if element == '.':
+    for note_num in steps:
+        if note_num is None:
             sequence.append('rest')
-        elif isinstance(element, int):
-            if element == 0:
-                note_num = base_note
-            else:
-                note_num = get_note_from_scale(base_note, element)
-            
+        else:
             note_str, octave = number_to_note(note_num)
             sequence.append(f"{note_str}{octave}")
     
     return sequence
 
-async def arpeggiator_loop():
-    global active_arps
-    
-    while True:
-        # Calculate sleep time based on BPM and rate
-        # Rate is notes per beat, so sleep time is (60/BPM)/rate
-        sleep_time = (60.0 / ARP_BPM) * float(ARP_RATE)
-        
-        with arp_lock:
-            # Process each active arpeggio
-            for note_id, arp_data in list(active_arps.items()):
-                if not arp_data['active'] and not ARP_OVERLAY:
-                    # Remove inactive arps if not overlayed
-                    if arp_data['current_note'] is not None:
-                        fluidsynth.stop_Note(arp_data['current_note'])
-                        arp_data['current_note'] = None
-                    del active_arps[note_id]
-                    continue
-                
-                # Get the current step and pattern
-                step      = arp_data['step']
-                pattern   = arp_data['pattern']
-                base_note = arp_data['base_note']
-                
-                # Get the current pattern element
-                if step < len(pattern):
-                    element = pattern[step]
-                    
-                    # Process the element
-                    if element == '.':
-                        # Rest - stop any currently playing note
-                        if arp_data['current_note'] is not None:
-                            fluidsynth.stop_Note(arp_data['current_note'])
-                            arp_data['current_note'] = None
-                    else:  # Handle all numeric elements, including 0
-                        # Stop previous note if any
-                        if arp_data['current_note'] is not None:
-                            fluidsynth.stop_Note(arp_data['current_note'])
-                        
-                        # Calculate the new note
-                        if ARP_DIRECTION == "random":
-                            rez = flip()
-                            if rez < 0:
-                                logging.info(f"scrambling pattern...")
-                        else:
-                            rez = 1
-
-                        # If element is 0, use the base note directly
-                        if element == 0:
-                            new_note = base_note
-                        else:
-                            new_note = get_note_from_scale(base_note, rez * element)
-                        
-                        # If scale restriction is enabled, map to the scale
-                        if ONLY_SCALE_PERMITTED:
-                            original_note = new_note
-                            new_note = map_midi_key_to_scale(new_note)
-                            if original_note != new_note:
-                                logging.debug(f"Mapped arp note {original_note} to {new_note} (in scale)")
-
-                        new_note_str = number_to_note(new_note)
-
-                        logging.warning("\tnote: %s / %s-%s" % (new_note, new_note_str[0], new_note_str[1]))
-
-                        # Play the new note
-                        fluidsynth.play_Note(new_note)
-                        arp_data['current_note'] = new_note
-                
-                # Increment step
-                arp_data['step'] = (step + 1) % len(pattern)
-        
-        # Sleep until next beat
-        await asyncio.sleep(sleep_time)
+def arp_step_note(base_note, element, rez):
+    """The note an arp pattern element plays for a base note, None for a rest"""
+    if element == '.':
+        return None
 
-def start_arpeggiator():
-    global arp_loop
-    
-    if arp_loop is None:
-        # Start the arpeggiator loop in a separate thread
-        def run_arp_loop():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(arpeggiator_loop())
-        
-        arp_thread = threading.Thread(target=run_arp_loop, daemon=True)
-        arp_thread.start()
-        arp_loop = arp_thread
-        logging.info("Arpeggiator started")
+    try:
+        # If element is 0, use the base note directly
+        if element == 0:
+            new_note = base_note
+        else:
+            new_note = get_note_from_scale(base_note, rez * element)
 
-def process_arp_pattern(pattern_str, direction=None):
-    # If direction is specified, it overrides the global setting
-    if direction is None:
-        direction = ARP_DIRECTION
-    
-    logging.debug(pattern_str)
+        # If scale restriction is enabled, map to the scale
+        if ONLY_SCALE_PERMITTED:
+            new_note = map_midi_key_to_scale(new_note)
 
-    # Parse the pattern string
-    elements = []
-    i = 0
-    while i < len(pattern_str):
-        if pattern_str[i] == '.':
-            # Rest
-            elements.append('.')
-            i += 1
-        elif pattern_str[i] in '+-':
-            # Note offset
-            sign = 1 if pattern_str[i] == '+' else -1
-            i += 1
-            num_str = ''
-            while i < len(pattern_str) and pattern_str[i].isdigit():
-                num_str += pattern_str[i]
-                i += 1
-            if num_str:
-                elements.append(sign * int(num_str))
-        else:
-            # Skip invalid characters
-            i += 1
-    
-    logging.debug(elements)
+    except Exception as e:
+        logging.debug(f"No arp note for {base_note} {element:+}: {e}")
+        return None
+
+    # off the end of the keyboard, sit this one out
+    if not 0 <= new_note <= 127:
+        return None
+
+    return new_note
+
+def compile_arp_pattern():
+    """
+    Turn ARP_PATTERN into a table of the notes to play at each step, for every base note
+    and both directions (random flips between them), so pressing a key just picks a row
+    and an arp tick just indexes into it. Needs to be redone when the pattern, direction,
+    key or scale change.
+    """
+    global arp_pattern, arp_steps
+
+    t0      = time.perf_counter()
+    pattern = arp_pattern_elements()
+    rows    = list(arp_rows(pattern))
+
+    arp_pattern = pattern
+    arp_steps   = {1: rows[:128], -1: rows[128:]}
+
+    logging.info(f"Arp pattern compiled in {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+def arp_pattern_elements():
+    """ARP_PATTERN (in ARP_DIRECTION) as a list of steps, offsets and '.' rests"""
+    # Parse the pattern
+    pattern_str, pattern_direction = parse_arp_pattern(ARP_PATTERN)
+    logging.debug(f"arp pattern {ARP_PATTERN} morphed to {pattern_str}")
+    pattern                        = process_arp_pattern(pattern_str, pattern_direction)
+    logging.debug(f"final arp pattern {pattern}")
+
+    if not pattern:
+        logging.error(f"arp pattern {ARP_PATTERN} has no steps in it, using {PREDEFINED_PATTERNS['increment']}")
+        pattern = process_arp_pattern(PREDEFINED_PATTERNS['increment'], pattern_direction)
+
+    return pattern
+
+def arp_rows(pattern):
+    """The arp table a row (base note) at a time, going up then going down, see compile_arp_pattern()"""
+    for rez in (1, -1):
+        for base_note in range(128):
+            yield tuple(arp_step_note(base_note, element, rez) for element in pattern)
+
+def rebuild_derived_tables():
+    """(Re)build the lookup tables the note paths use, after the key/scale/pattern/etc. change"""
+    if CHORDS:
+        build_chord_table()
+
+    if ARP:
+        compile_arp_pattern()
+
+def arp_period(rate):
+    """Seconds between an arp's steps at rate (notes per beat), at the current BPM"""
+    return (60.0 / ARP_BPM) * float(rate)
+
+def anchor_arp_grid(now, beats=None):
+    """
+    Pin the beat grid down at now... carrying on the count at the BPM it was going at (after a
+    BPM change, so it keeps going from there at the new one), or starting it over at beats
+    """
+    if beats is None:
+        if arp_grid['time'] is None:
+            return
+        beats = arp_grid['beats'] + (now - arp_grid['time']) * arp_grid['bpm'] / 60.0
+
+    arp_grid.update(time=now, beats=beats, bpm=ARP_BPM)
+
+def first_arp_due(now, rate):
+    """
+    When a new arp at rate gets its first step... ARP_PHASE of a step from now, or with --arp-sync
+    that far on from the next step on the shared grid (the first arp when none are going starts it)
+    """
+    if not ARP_SYNC or not active_arps or arp_grid['time'] is None:
+        if ARP_SYNC:
+            anchor_arp_grid(now, 0.0)
+        return now + float(ARP_PHASE) * arp_period(rate)
+
+    step  = float(rate)
+    phase = float(ARP_PHASE)
+    beats = arp_grid['beats'] + (now - arp_grid['time']) * arp_grid['bpm'] / 60.0
+    due   = (math.ceil(beats / step - phase) + phase) * step
+
+    return now + (due - beats) * 60.0 / ARP_BPM
+
+def next_arp_due():
+    """When the next arp step's due, None if there aren't any... stale heap entries get cleared off the top on the way"""
+    while arp_heap:
+        due, seq, note_id = arp_heap[0]
+
+        arp_data = active_arps.get(note_id)
+        if arp_data is not None and arp_data['seq'] == seq:
+            return due
+
+        heapq.heappop(arp_heap)
+
+    return None
+
+def schedule_arp(note_id, arp_data, due):
+    """(Re)file an arp in the heap... whatever entry it had before goes stale, and gets skipped when it comes up"""
+    arp_data['seq'] = seq = next(arp_seq)
+    arp_data['due'] = due
+    heapq.heappush(arp_heap, (due, seq, note_id))
+
+def run_due_arps(now, record=False):
+    """
+    Step every arp that's due by now (only those, the rest stay put in the heap) and schedule
+    each one's next step. Returns when the next one's due, None if there's nothing left going.
+    record is for the real clock, keeping track of how late the steps are (see record_arp_tick()).
+    """
+    while True:
+        due = next_arp_due()
+        if due is None or due > now:
+            return due
+
+        _, _, note_id = heapq.heappop(arp_heap)
+        arp_data      = active_arps[note_id]
+
+        if not arp_step(note_id, arp_data):
+            continue
+
+        if record:
+            record_arp_tick(now - due, now, arp_data)
+
+        # the next step's a period on from when this one was due, not when it actually happened,
+        # so lateness doesn't pile up... unless it's more than a whole step behind (stopped in a
+        # debugger, laptop asleep...), then the missed steps are skipped rather than rattled off
+        period   = arp_period(arp_data['rate'])
+        next_due = due + period
+        behind   = now - next_due
+
+        if behind > period:
+            missed                = int(behind // period)
+            next_due             += missed * period
+            arp_clock['skipped'] += missed
+
+        schedule_arp(note_id, arp_data, next_due)
+
+def arp_step(note_id, arp_data):
+    """Advance an arpeggio by one step, False if it's done (and gone)"""
+    if not arp_data['active'] and not ARP_OVERLAY:
+        # Remove inactive arps if not overlayed
+        if arp_data['current_note'] is not None:
+            stop_layers(arp_data['current_note'], arp_data['layers'])
+            arp_data['current_note'] = None
+        del active_arps[note_id]
+        return False
+
+    # Get the current step... random direction flips a coin each step for which row to play
+    step      = arp_data['step']
+
+    if ARP_DIRECTION == "random" and flip() < 0:
+        new_note = arp_data['steps_down'][step]
+    else:
+        new_note = arp_data['steps'][step]
+
+    # Stop previous note if any (a rest just stops it)
+    if arp_data['current_note'] is not None:
+        stop_layers(arp_data['current_note'], arp_data['layers'])
+        arp_data['current_note'] = None
+
+    # shifted by the octave control... off the end of the keyboard is a rest
+    if new_note is not None:
+        new_note += arp_data['shift']
+        if not playable(new_note):
+            new_note = None
+
+    if new_note is not None:
+        if event_log:
+            event_log.log(EV_ARP_STEP, arp_data['channel'], new_note, step)
+
+        # Play the new note
+        play_layers(new_note, arp_data['layers'], arp_data['velocity'])
+        arp_data['current_note'] = new_note
+
+        # the first note the arp plays is the end of the line for the key press' latency
+        if arp_data['t_recv'] is not None:
+            latency.played("arp", arp_data['base_note'], arp_data['t_recv'])
+            arp_data['t_recv'] = None
+
+    # Increment step
+    arp_data['step'] = (step + 1) % len(arp_data['steps'])
+    return True
+
+def record_arp_tick(lateness, now, arp_data):
+    """Keep track of how late each arp step is, and how far apart they come, so we can tell if the tempo holds up"""
+    if arp_clock['started'] is None:
+        arp_clock['started'] = now
+
+    arp_clock['ticks']     += 1
+    arp_clock['last_tick']  = now
+    arp_clock['late_sum']  += lateness
+    arp_clock['late_max']   = max(arp_clock['late_max'], lateness)
+
+    # a step is rate beats on from the arp's last one
+    if arp_data['last_step'] is not None:
+        arp_clock['beats']     += float(arp_data['rate'])
+        arp_clock['beat_time'] += now - arp_data['last_step']
+    arp_data['last_step'] = now
+
+    arp_lateness.append(lateness)
+
+def arp_clock_report():
+    """How well did the arp keep time?"""
+    ticks = arp_clock['ticks']
+
+    if ticks < 2 or not arp_clock['beat_time']:
+        logging.warning("arp clock: not enough steps for a report")
+        return
+
+    elapsed       = arp_clock['last_tick'] - arp_clock['started']
+    effective_bpm = arp_clock['beats'] / arp_clock['beat_time'] * 60.0
+    recent        = sorted(arp_lateness)
+
+    logging.warning(f"arp clock: {ticks} steps over {elapsed:.1f}s, {effective_bpm:.3f} BPM (asked for {ARP_BPM}), {arp_clock['skipped']} skipped")
+    logging.warning(f"arp clock: lateness mean {arp_clock['late_sum'] / ticks * 1000:.2f}ms, "
+                    f"p99 {recent[int(len(recent) * 0.99)] * 1000:.2f}ms (last {len(recent)} steps), max {arp_clock['late_max'] * 1000:.2f}ms")
+
+async def arpeggiator_loop():
+    """
+    Step the arps as they come due on the monotonic clock, each at its own rate... sleeps until
+    the earliest one's due (or a new arp starts), and only touches the ones that are. Steps are
+    scheduled against when they were due rather than when they happened, so the tempo doesn't drift
+    """
+    loop = asyncio.get_running_loop()
+
+    while True:
+        arp_wakeup.clear()
+
+        due   = run_due_arps(loop.time(), record=True)
+        timer = loop.call_at(due, arp_wakeup.set) if due is not None else None
+
+        await arp_wakeup.wait()
+
+        if timer:
+            timer.cancel()
+
+def process_arp_pattern(pattern_str, direction=None):
+    # If direction is specified, it overrides the global setting
+    if direction is None:
+        direction = ARP_DIRECTION
+    
+    logging.debug(pattern_str)
+
+    # Parse the pattern string
+    elements = []
+    i = 0
+    while i < len(pattern_str):
+        if pattern_str[i] == '.':
+            # Rest
+            elements.append('.')
+            i += 1
+        elif pattern_str[i] in '+-':
+            # Note offset
+            sign = 1 if pattern_str[i] == '+' else -1
+            i += 1
+            num_str = ''
+            while i < len(pattern_str) and pattern_str[i].isdigit():
+                num_str += pattern_str[i]
+                i += 1
+            if num_str:
+                elements.append(sign * int(num_str))
+        else:
+            # Skip invalid characters
+            i += 1
+    
+    logging.debug(elements)
 
     # Apply direction
     if direction == "down":
@@ -922,134 +1415,1567 @@ def process_arp_pattern(pattern_str, direction=None):
     
     return elements
 
-def start_arp(channel, note):
-    global active_arps
-    
-    if not ARP:
-        logging.warning("hey, ARP isn't enabled, bailing from start_arp()")
-        return
-    
-    # Parse the pattern
-    logging.debug("orig pattern...")
-    logging.debug(ARP_PATTERN)
-    pattern_str, pattern_direction = parse_arp_pattern(ARP_PATTERN)
-    logging.debug("morphed to...")
-    logging.debug(pattern_str)
-    pattern                        = process_arp_pattern(pattern_str, pattern_direction)
-    logging.debug("final pattern...")
-    logging.debug(pattern)
-    
-    # If latch is enabled, stop all other arps
-    if ARP_LATCH:
-        with arp_lock:
-            for note_id, arp_data in list(active_arps.items()):
-                if arp_data['current_note'] is not None:
-                    fluidsynth.stop_Note(arp_data['current_note'])
-                    arp_data['current_note'] = None
-            active_arps.clear()
-    
-    # Log the sequence of notes that will be played
-    sequence = get_arp_sequence_notes(note, pattern)
+def start_arp(channel, note, trigger, velocity=100):
+    global active_arps
+    
+    if not ARP:
+        logging.warning("hey, ARP isn't enabled, bailing from start_arp()")
+        return
+    
+    # off the ends of the compiled table
+    if not 0 <= note < len(arp_steps[1]):
+        logging.debug("no arp for note %s", note)
+        return
+
+    # If latch is enabled, stop all other arps
+    if ARP_LATCH:
+        for note_id, arp_data in list(active_arps.items()):
+            if arp_data['current_note'] is not None:
+                stop_layers(arp_data['current_note'], arp_data['layers'])
+                arp_data['current_note'] = None
+        active_arps.clear()
+    
+    # Log the sequence of notes that will be played... if anyone's listening
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        sequence = get_arp_sequence_notes(arp_steps[1][note])
+        logging.info(f"Arp sequence for note {number_to_note(note)[0]}{number_to_note(note)[1]}: {' '.join(sequence)}")
+        logging.info(f"Playing at rate: {ARP_RATE} notes per beat ({ARP_BPM} BPM)")
+    
+    # Create a new arpeggio entry... filed under the key that started it, so its release finds
+    # it even if the key or scale has changed in the meantime
+    note_id = f"{channel}:{trigger}"
+
+    # the same key again while its last arp's still going (--arp-overlay)... that one's done
+    replaced = active_arps.get(note_id)
+    if replaced and replaced['current_note'] is not None:
+        stop_layers(replaced['current_note'], replaced['layers'])
+
+    # its rate is whatever it is now, for as long as it goes
+    rate = ARP_RATE
+    due  = first_arp_due(arp_time(), rate)
+
+    active_arps[note_id] = arp_data = {
+        'channel':      channel,
+        'layers':       channel_layers.get(channel) or (channel,),
+        'base_note':    note,
+        'steps':        arp_steps[1][note],
+        'steps_down':   arp_steps[-1][note],
+        'step':         0,
+        'active':       True,
+        'current_note': None,
+        'shift':        OCTAVE_SHIFT * NOTES_IN_OCTAVE,
+        'velocity':     velocity,
+        'rate':         rate,
+        'due':          due,
+        'seq':          None,
+        'last_step':    None,
+        't_recv':       latency.t_recv if latency else None
+    }
+
+    schedule_arp(note_id, arp_data, due)
+
+    # the arp loop might be asleep 'til later than this one's due
+    if arp_wakeup is not None:
+        arp_wakeup.set()
+
+def stop_arp(channel, trigger):
+    global active_arps
+    
+    if not ARP:
+        logging.warning("hey, ARP isn't enabled, bailing from stop_arp()")
+        return
+    
+    note_id = f"{channel}:{trigger}"
+    if note_id in active_arps:
+        # Mark as inactive (will be removed in the loop if not overlayed)
+        active_arps[note_id]['active'] = False
+            
+        # If not overlayed, stop the current note
+        if not ARP_OVERLAY and active_arps[note_id]['current_note'] is not None:
+            stop_layers(active_arps[note_id]['current_note'], active_arps[note_id]['layers'])
+            active_arps[note_id]['current_note'] = None
+    
+    logging.debug("Stopped arpeggio for key %s", trigger)
+
+def stop_sound(chan, note):
+    global midi_player
+
+    if event_log:
+        event_log.log(EV_NOTE_OFF, chan, note)
+
+    # stop arpy mcArpems
+    if ARP:
+        logging.debug("\t<--- [channel: %s] [midi-num: %s]", chan, note)
+
+        # slam on the bräx
+        if not ARP_LATCH:
+            stop_arp(chan, note)
+
+    # bye bye love... whatever this key started, chord or note, is in the voice table
+    else:
+        voicez = active_voices.pop((chan, note), ())
+
+        logging.debug("\t<--- [channel: %s] [midi-num: %s] %s", chan, note, voicez)
+
+        for c, z in voicez:
+            stop_note(z, c)
+
+def panic():
+    """Everything off, right now"""
+    if event_log:
+        event_log.log(EV_PANIC)
+
+    all_voices_off()
+
+def all_voices_off(channel=None):
+    """
+    Stop every note we know is sounding (just on channel, if there is one)... arps and held
+    keys, no need to sweep the synth
+    """
+    for note_id, arp_data in list(active_arps.items()):
+        if channel is None or arp_data['channel'] == channel:
+            if arp_data['current_note'] is not None:
+                stop_layers(arp_data['current_note'], arp_data['layers'])
+            del active_arps[note_id]
+
+    for (chan, trigger), voicez in list(active_voices.items()):
+        if channel is None or chan == channel:
+            for c, z in voicez:
+                stop_note(z, c)
+            del active_voices[(chan, trigger)]
+
+    # and anything else still holding a voice
+    for chan, note in list(voices):
+        if channel is None or chan == channel:
+            stop_note(note, chan)
+
+#
+# control changes... each controller number gets its own handler, see CC_MAP
+#
+def cc_gain(channel, value):
+    """use the NMSME rotator to change volume"""
+    gain = int(value / 127 * 100)
+    if event_log:
+        event_log.log(EV_GAIN, channel, 7, gain)
+
+    channel_gain[channel] = gain
+    apply_gain(channel)
+
+def apply_gain(channel):
+    """
+    Send an input's volume to wherever its notes go right now... its preset's layer channels, or
+    its own channel. Anything per channel we add has to go to all of them too, see channel_layers
+    """
+    gain = channel_gain.get(channel)
+    if gain is None:
+        return
+
+    # channel, gain, value (0-100?)
+    for c in channel_layers.get(channel) or (channel,):
+        control_change(c, 7, gain)
+
+def cc_octave(channel, value):
+    """Shift whatever gets played next up or down a few octaves, the middle of the range is no shift"""
+    global OCTAVE_SHIFT
+
+    OCTAVE_SHIFT = round(value / 127 * 2 * OCTAVE_RANGE) - OCTAVE_RANGE
+    if event_log:
+        event_log.log(EV_CONTROL, 0, CC_HANDLERS["octave"][1], OCTAVE_SHIFT)
+
+def cc_arp_bpm(channel, value):
+    """Speed the arps up or slow them down, the arp loop picks it up on its next tick"""
+    global ARP_BPM
+
+    low, high = ARP_BPM_RANGE
+    ARP_BPM   = low + value / 127 * (high - low)
+    anchor_arp_grid(arp_time())
+    if event_log:
+        event_log.log(EV_CONTROL, 0, CC_HANDLERS["arp-bpm"][1], int(ARP_BPM))
+
+# name -> (handler, id for the event log)
+CC_HANDLERS = {
+    "gain":    (cc_gain,    1),
+    "octave":  (cc_octave,  2),
+    "arp-bpm": (cc_arp_bpm, 3),
+}
+
+def parse_cc_map(spec):
+    """'7=gain,1=octave' -> {7: 'gain', 1: 'octave'}"""
+    cc_map = {}
+
+    for item in filter(None, spec.split(',')):
+        control, _, name = item.partition('=')
+        name = name.strip().lower()
+
+        if not control.strip().isdigit() or not 0 <= int(control) <= 127 or name not in CC_HANDLERS:
+            logging.error(f"Bad --cc-map entry '{item}', should be CONTROL=HANDLER with HANDLER one of {', '.join(CC_HANDLERS)}")
+            sys.exit(1)
+
+        cc_map[int(control)] = name
+
+    return cc_map
+
+def flush_controls(now=None, force=False):
+    """
+    Apply the latest value for each controller that's moved, at most once every CC_INTERVAL...
+    whatever's still pending gets applied on the next call after that (the engine loop makes sure
+    there is one), so a sweep always ends up on its exact final value
+    """
+    global cc_next_due
+
+    if not cc_pending:
+        return
+
+    if now is None:
+        now = time.monotonic()
+
+    if now < cc_next_due and not force:
+        return
+
+    cc_next_due = now + CC_INTERVAL
+
+    for key, value in list(cc_pending.items()):
+        del cc_pending[key]
+
+        if cc_applied.get(key) == value:
+            continue
+        cc_applied[key] = value
+
+        channel, control = key
+
+        name = CC_MAP.get(control)
+        if name is None:
+            if control not in cc_unmapped:
+                cc_unmapped.add(control)
+                logging.info(f"control {control} isn't mapped to anything, see --cc-map")
+            continue
+
+        CC_HANDLERS[name][0](channel, value)
+        cc_counts['applied'] += 1
+
+#
+# presets... see setup_presets()
+#
+def setup_presets(spec):
+    """
+    '0,42+48,89' -> preset_slots, with every program getting a synth channel of its own (after the
+    inputs' channels). Returns [(channel, bank, program, name)] for init_synth() to warm up.
+    """
+    free     = iter(INPUT_CHANNELS[len(inputs):])
+    programs = {}
+
+    for slot in filter(None, spec.split(',')):
+        layers = []
+
+        for program in slot.split('+'):
+            bank, number, name = resolve_instrument(program.strip())
+
+            if (bank, number) not in programs:
+                channel = next(free, None)
+                if channel is None:
+                    logging.error(f"Too many presets, there are only {len(INPUT_CHANNELS)} synth channels to go around")
+                    sys.exit(1)
+
+                programs[(bank, number)] = (channel, name)
+
+            layers.append(programs[(bank, number)][0])
+
+        preset_slots.append(tuple(layers))
+
+    return [(channel, bank, number, name) for (bank, number), (channel, name) in programs.items()]
+
+def select_preset(chan, n):
+    """Point an input at preset slot n... the channels are all set up already, so that's all it takes"""
+    if not preset_slots:
+        # no --presets, just change the input's own program (the first note might take a moment)
+        logging.info(f"channel {chan} switching to program {n}")
+        set_instrument(chan, n)
+        return
+
+    channel_layers[chan] = preset_slots[n % len(preset_slots)]
+    logging.info(f"channel {chan} switching to preset {n % len(preset_slots)} (synth channels {channel_layers[chan]})")
+
+    # the knob stays where it was, rather than jumping back to the preset's own volume
+    apply_gain(chan)
+
+def preset_pad(msg):
+    """
+    The preset pad (raw note PRESET_PAD) held down turns the next pad into a preset switch... the
+    pad n up (or down) from it picks preset n-1. True if the message was taken care of here.
+    """
+    if msg.note == PRESET_PAD:
+        if msg.type == "note_on" and msg.velocity:
+            preset_pad_held.add(msg.channel)
+        else:
+            preset_pad_held.discard(msg.channel)
+        return True
+
+    if msg.channel in preset_pad_held and msg.type == "note_on" and msg.velocity:
+        select_preset(msg.channel, abs(msg.note - PRESET_PAD) - 1)
+        return True
+
+    return False
+
+def handle_message(msg, t_recv=None):
+    """Do whatever a midi message from the NMVSE asks for (t_recv is when it came in, in perf_counter_ns)"""
+    if latency:
+        latency.t_recv = t_recv
+
+    message_counts[msg.type] += 1
+
+    # the preset pad and whatever's hit while it's held down don't play anything
+    if PRESET_PAD is not None and msg.type in ("note_on", "note_off") and preset_pad(msg):
+        return
+
+    # notes, chords, whatever
+    if msg.type == "note_on" and msg.velocity:
+
+        msg.note = msg.note - 12
+        # print("MidiNote: %s" % msg.note)
+
+        if HARMONIZER:
+            note_str, octave = number_to_note(msg.note)
+            logging.info("harmonizer....")
+            logging.info("%s-%s" % (note_str, octave))
+            harmonize(note_str)
+        else:
+            start_sound(msg.channel, msg.note, msg.velocity)
+
+    # (a note_on with no velocity is a note_off, most MIDI files are full of them)
+    elif msg.type in ("note_off", "note_on"):
+        msg.note = msg.note - 12
+        stop_sound(msg.channel, msg.note)
+
+    elif msg.type == "polytouch":
+        print(msg)
+
+    # all sound off/all notes off
+    elif msg.type == "control_change" and msg.control in PANIC_CONTROLS:
+        panic()
+
+    # knobs and sliders... only the latest value counts, flush_controls() gets to it
+    elif msg.type == "control_change":
+        key = (msg.channel, msg.control)
+        if key in cc_pending:
+            cc_counts['coalesced'] += 1
+        cc_pending[key] = msg.value
+        if controls_wakeup:
+            controls_wakeup.set()
+
+    elif msg.type == "program_change":
+        select_preset(msg.channel, msg.program)
+
+    elif msg.type == "aftertouch":
+        print(msg)
+
+    elif msg.type == "pitchwheel":
+        print(msg)
+
+    else:
+        logging.warning("not sure how to handle message type - %s" % msg.type)
+
+#
+# latency instrumentation
+#
+class LatencyHistogram:
+    """
+    HDR-style histogram of nanosecond latencies. Values are bucketed by power of two, each
+    power split into 2**SUB_BITS linear sub-buckets, so any recorded value is off by less
+    than 1/2**SUB_BITS (~3%) at any scale, and recording is just a bit of integer math.
+    """
+
+    SUB_BITS = 5
+
+    def __init__(self):
+        self.counts = [0] * (64 << self.SUB_BITS)
+        self.total  = 0
+        self.max    = 0
+
+    def index(self, ns):
+        exponent = ns.bit_length() - self.SUB_BITS - 1
+        if exponent <= 0:
+            return ns
+        return (exponent << self.SUB_BITS) + (ns >> exponent)
+
+    def value(self, index):
+        """The highest value that lands in a bucket"""
+        if index < (2 << self.SUB_BITS):
+            return index
+        exponent = (index >> self.SUB_BITS) - 1
+        return ((index - (exponent << self.SUB_BITS) + 1) << exponent) - 1
+
+    def record(self, ns):
+        self.counts[self.index(max(0, ns))] += 1
+        self.total += 1
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, pct):
+        target  = max(1, int(self.total * pct / 100.0 + 0.5))
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return min(self.value(index), self.max)
+        return self.max
+
+class LatencyStats:
+    """
+    Input to sound timings, per path (chords, notes, arp): from the message coming in off
+    the NMVSE to the note mapped, and to the synth call returning (for the arp, its first
+    note). Keeps the worst few around too.
+    """
+
+    WORST = 10
+
+    def __init__(self):
+        self.t_recv     = None
+        self.histograms = {}
+        self.worst      = []    # min-heap of (ns, mode, note)
+
+    def histogram(self, mode, stage):
+        key = (mode, stage)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        return self.histograms[key]
+
+    def mapped(self, mode):
+        if self.t_recv is not None:
+            self.histogram(mode, "mapped").record(time.perf_counter_ns() - self.t_recv)
+
+    def played(self, mode, note, t_recv=None):
+        t_recv = self.t_recv if t_recv is None else t_recv
+        if t_recv is None:
+            return
+
+        ns = time.perf_counter_ns() - t_recv
+        self.histogram(mode, "sound").record(ns)
+
+        if len(self.worst) < self.WORST:
+            heapq.heappush(self.worst, (ns, mode, note))
+        elif ns > self.worst[0][0]:
+            heapq.heapreplace(self.worst, (ns, mode, note))
+
+    def report(self):
+        print("Input to sound latency (ms)")
+        print("=" * 72)
+        print(f"{'path':8} {'stage':8} | {'count':>8} {'p50':>9} {'p99':>9} {'p99.9':>9} {'max':>9}")
+
+        for (mode, stage), h in sorted(self.histograms.items()):
+            if not h.total:
+                continue
+            print(f"{mode:8} {stage:8} | {h.total:8} " + ' '.join(f"{ns / 1e6:9.3f}" for ns in (h.percentile(50), h.percentile(99), h.percentile(99.9), h.max)))
+
+        if self.worst:
+            print("\nWorst offenders")
+            print("-" * 40)
+            for ns, mode, note in sorted(self.worst, reverse=True):
+                print(f"{ns / 1e6:9.3f}ms | {mode:8} | note {note}")
+
+#
+# hot path event log
+#
+EV_NOTE_ON      = 1
+EV_NOTE_OFF     = 2
+EV_ARP_STEP     = 3
+EV_GAIN         = 4
+EV_PANIC        = 5
+EV_CONTROL      = 6
+
+def format_event(event, channel, note, value):
+    if event == EV_NOTE_ON:
+        return f"starting note.... [ch-{channel} / {note}]"
+    if event == EV_NOTE_OFF:
+        return f"\tstop! [ch-{channel} / {note}]"
+    if event == EV_ARP_STEP:
+        note_str, octave = number_to_note(note)
+        return f"\tnote: {note} / {note_str}-{octave} (step {value})"
+    if event == EV_GAIN:
+        return f"gain -> {value}"
+    if event == EV_PANIC:
+        return "panic! all notes off"
+    if event == EV_CONTROL:
+        name = next((name for name, (_, id) in CC_HANDLERS.items() if id == note), note)
+        return f"{name} -> {value}"
+    return f"event {event}: {channel} {note} {value}"
+
+class EventLog:
+    """
+    Ring buffer of fixed-size binary records for what happens on the note path.
+
+    Logging a note used to mean formatting a string and writing it to the terminal right
+    there in the middle of playing it. Now log() just packs a few numbers into a
+    preallocated buffer, and a background thread formats and logs them (if echo is on).
+    dump() prints the last N seconds of events, for after the fact.
+
+    Slots are handed out by an itertools.count() (atomic), and each record carries its
+    sequence number, so the reader can tell a slot that hasn't been (re)written yet.
+    """
+
+    RECORD = struct.Struct('<qdBBhh')   # seq, monotonic time, event, channel, note, value
+
+    def __init__(self, capacity=65536, echo=True, interval=0.1):
+        self.capacity = capacity
+        self.seq      = itertools.count()
+        self.head     = 0       # (roughly) the next seq to be written, just a hint for the reader
+        self.flushed  = 0
+        self.echo     = echo
+        self.interval = interval
+
+        # all 0xff bytes reads back as seq -1, i.e. an empty slot
+        self.buf      = bytearray(b'\xff') * (self.RECORD.size * capacity)
+
+        if echo:
+            threading.Thread(target=self.flusher, daemon=True).start()
+
+    def log(self, event, channel=0, note=0, value=0):
+        seq = next(self.seq)
+        self.RECORD.pack_into(self.buf, (seq % self.capacity) * self.RECORD.size, seq, time.monotonic(), event, channel & 0xff, note, value)
+        self.head = seq + 1
+
+    def read(self, seq):
+        """The record for seq, or None if it hasn't been written (or has been written over)"""
+        record = self.RECORD.unpack_from(self.buf, (seq % self.capacity) * self.RECORD.size)
+        return record if record[0] == seq else None
+
+    def flush(self):
+        while True:
+            record = self.read(self.flushed)
+
+            if record is None:
+                # lapped? skip ahead to the oldest thing still in the buffer
+                if self.head - self.flushed > self.capacity:
+                    logging.warning(f"event log: lost {self.head - self.capacity - self.flushed} events")
+                    self.flushed = self.head - self.capacity
+                    continue
+                return
+
+            seq, t, event, channel, note, value = record
+            logging.warning(format_event(event, channel, note, value))
+            self.flushed += 1
+
+    def flusher(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def dump(self, seconds):
+        """Print the events from the last so many seconds"""
+        now     = time.monotonic()
+        records = [self.RECORD.unpack_from(self.buf, slot * self.RECORD.size) for slot in range(self.capacity)]
+        records = sorted(r for r in records if r[0] >= 0 and now - r[1] <= seconds)
+
+        print(f"Events from the last {seconds}s ({len(records)})")
+        print("=" * 40)
+        for seq, t, event, channel, note, value in records:
+            print(f"{t - now:+10.3f}s | {format_event(event, channel, note, value)}")
+
+class EventQueue:
+    """
+    Bounded single-producer/single-consumer queue between a midi input and the sound
+    engine (each input gets its own, they can share the engine's wakeup event).
+
+    The input side never waits on the engine: appending to/popping from a deque and
+    setting a dict key are each atomic, so there's no lock for a key press to get stuck
+    behind while an arp tick is busy with fluidsynth. wakeup is called after each put,
+    to give the engine a nudge. When things back up -
+
+    - note_off and panic messages jump the line
+    - control changes only keep the latest value for each controller
+    - past capacity, new note_ons are dropped (and counted) rather than piling up
+
+    Since note_offs can overtake their note_ons, each note_off remembers how many note_ons
+    for the same key had been queued when it arrived. If the engine hasn't got to that one
+    yet, the note_on is skipped when it does - the key was already let go. A panic does the
+    same for every key, so nothing pressed before it starts up after it.
+    """
+
+    def __init__(self, capacity=256, wakeup=None):
+        self.capacity  = capacity
+
+        self.urgent    = collections.deque()   # (msg, note_ons queued for its key at the time)
+        self.events    = collections.deque()
+        self.controls  = {}                    # (channel, control) -> latest msg
+
+        # per (channel, note) note_on counts - only the producer writes queued, only the consumer handled
+        self.queued    = collections.Counter()
+        self.handled   = collections.Counter()
+        self.skip_upto = {}
+
+        self.wakeup    = wakeup
+
+        self.dropped   = 0
+        self.coalesced = 0
+
+    # producer side
+
+    def put(self, msg):
+        """Queue a message from the input loop, returns False if it had to be dropped"""
+        # when it came in, for the latency numbers
+        t = time.perf_counter_ns()
+
+        # (velocity 0 note_ons are note_offs too)
+        if msg.type == "note_off" or msg.type == "note_on" and not msg.velocity:
+            key = (msg.channel, msg.note)
+            self.urgent.append((t, msg, self.queued[key]))
+
+        elif msg.type == "control_change" and msg.control in PANIC_CONTROLS:
+            self.urgent.append((t, msg, dict(self.queued)))
+
+        elif msg.type == "control_change":
+            key = (msg.channel, msg.control)
+            if key in self.controls:
+                self.coalesced += 1
+            self.controls[key] = (t, msg)
+
+        elif len(self.events) >= self.capacity:
+            self.dropped += 1
+            logging.debug("engine queue full, dropped %s", msg.type)
+            return False
+
+        else:
+            if msg.type == "note_on":
+                self.queued[(msg.channel, msg.note)] += 1
+            self.events.append((t, msg))
+
+        if self.wakeup:
+            self.wakeup()
+        return True
+
+    # consumer side
+
+    def drain(self, handle):
+        """Hand everything queued so far to handle(msg, time received), most urgent first"""
+
+        while True:
+            if self.urgent:
+                t, msg, queued = self.urgent.popleft()
+
+                # a panic... every note_on queued before it is as good as released
+                if msg.type == "control_change":
+                    for key, count in queued.items():
+                        self.skip_upto[key] = max(self.skip_upto.get(key, 0), count)
+
+                # released before the engine even got to the press? Then never start it (the
+                # note_off still goes through if an earlier press of the key might be sounding)
+                elif self.handled[(msg.channel, msg.note)] < queued:
+                    self.skip_upto[(msg.channel, msg.note)] = queued
+                    if not self.handled[(msg.channel, msg.note)]:
+                        continue
+
+            elif self.controls:
+                key, (t, msg) = self.controls.popitem()
+
+            elif self.events:
+                t, msg = self.events.popleft()
+
+                if msg.type == "note_on":
+                    key = (msg.channel, msg.note)
+                    self.handled[key] += 1
+                    if self.handled[key] <= self.skip_upto.get(key, 0):
+                        continue
+
+            else:
+                return
+
+            handle(msg, t)
+
+#
+# the event loop... inputs, the sound engine, the arps and knob coalescing all live on the one
+# asyncio loop, so nothing the engine or the arps touch needs a lock
+#
+def wake_engine():
+    """Nudge the engine task (from any thread, the midi backend calls back on its own)"""
+    # already nudged and not cleared yet? Then it's yet to drain, and will see this one too
+    if not engine_wakeup.is_set():
+        engine_loop.call_soon_threadsafe(engine_wakeup.set)
+
+async def engine_task():
+    """Work through what the inputs queue up"""
+    while True:
+        await engine_wakeup.wait()
+        engine_wakeup.clear()
+
+        # every input's queue, each one's urgent stuff first
+        for inp in inputs:
+            inp['queue'].drain(handle_message)
+
+async def controls_task():
+    """Apply knob moves as they come, but no more than once every CC_INTERVAL, see flush_controls()"""
+    while True:
+        await controls_wakeup.wait()
+        controls_wakeup.clear()
+
+        await asyncio.sleep(max(0.0, cc_next_due - time.monotonic()))
+        flush_controls(force=True)
+
+async def replay_task(filename, speed):
+    """Feed a recorded session in, then give it a bit to ring out"""
+    async for port, msg in replay_session(filename, speed):
+        deliver(port, msg)
+
+    await asyncio.sleep(REPLAY_TAIL)
+
+async def run_live():
+    """
+    Play until told to stop (SIGINT/SIGTERM) or, when replaying, the session's over... then
+    the tasks are cancelled and everything's shut down in order, right here
+    """
+    global engine_loop, engine_wakeup, controls_wakeup, arp_wakeup
+
+    engine_loop     = asyncio.get_running_loop()
+    engine_wakeup   = asyncio.Event()
+    controls_wakeup = asyncio.Event()
+    arp_wakeup      = asyncio.Event()
+    stopping        = asyncio.Event()
+
+    def interrupted():
+        logging.error("caught interrupt signal... shutting down....")
+        stopping.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        engine_loop.add_signal_handler(sig, interrupted)
+
+    if hasattr(signal, 'SIGUSR1'):
+        engine_loop.add_signal_handler(signal.SIGUSR1, usr1_handler)
+
+    metrics = start_metrics_server(args.metrics_port) if args.metrics_port else None
+
+    tasks = [asyncio.create_task(engine_task()), asyncio.create_task(controls_task())]
+    logging.info("Sound engine started")
+
+    # (ticking along regardless if the control socket might turn the arp on)
+    if ARP or args.control_socket:
+        tasks.append(asyncio.create_task(arpeggiator_loop()))
+        logging.info("Arpeggiator started")
+
+    if args.control_socket:
+        tasks.append(asyncio.create_task(control_server(args.control_socket)))
+
+    if args.replay:
+        logging.warning(f"replaying {args.replay}...")
+        replay = asyncio.create_task(replay_task(args.replay, args.replay_speed))
+        replay.add_done_callback(lambda task: stopping.set())
+        tasks.append(replay)
+    else:
+        logging.warning("galloping along with our polling... time to start interacting with NMVSE!")
+
+        # whatever's there already, then the watcher takes care of the rest (and anything that comes and goes)
+        with startup_phase("device open"):
+            names = await engine_loop.run_in_executor(None, mido.get_input_names)
+            for port, inp in enumerate(inputs):
+                if not attach_input(port, names):
+                    logging.warning(f"can't see the {inp['pattern'].strip()} machine.... waiting for it to show up")
+
+        tasks.append(asyncio.create_task(watch_inputs()))
+
+    if args.startup_report:
+        startup_report()
+
+    await stopping.wait()
+
+    # inputs closed, then the rest
+    for inp in inputs:
+        if inp['midi'] is not None:
+            inp['midi'].close()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    if metrics:
+        metrics.shutdown()
+
+    shutdown()
+
+#
+# live reconfiguration... --control-socket takes a JSON object a line, the settings to change, e.g.
+#
+#   {"key": "F#", "scale": "dorian", "arp_bpm": 140}
+#
+# and answers each with a line of its own: {"ok": true, "settings": {...}} or {"ok": false, "error": "..."}.
+# The new tables get built a few rows at a time in between the inputs' events, with the new settings
+# swapped in just for that (see swapped_globals()), then everything changes over at once.
+#
+ARP_DIRECTIONS  = [direction.value for direction in ArpDirection]
+CONTROL_FIELDS  = ('key', 'scale', 'only_scale_permitted', 'mode', 'arp', 'arp_pattern', 'arp_direction',
+                   'arp_bpm', 'arp_rate', 'arp_phase', 'arp_sync', 'instrument', 'input')
+
+@contextlib.contextmanager
+def swapped_globals(values):
+    """Run with some globals set to something else for a bit... only safe with nothing else running in between"""
+    g     = globals()
+    saved = {name: g[name] for name in values}
+
+    g.update(values)
+    try:
+        yield
+    finally:
+        g.update(saved)
+
+def current_settings():
+    """What the control socket can change, as it stands"""
+    return {
+        'key':                  KEY_NAME,
+        'scale':                SCALE_NAME,
+        'only_scale_permitted': ONLY_SCALE_PERMITTED,
+        'mode':                 "chords" if CHORDS else "notes",
+        'arp':                  ARP,
+        'arp_pattern':          ARP_PATTERN,
+        'arp_direction':        ARP_DIRECTION,
+        'arp_bpm':              ARP_BPM,
+        'arp_rate':             str(ARP_RATE),
+        'arp_phase':            str(ARP_PHASE),
+        'arp_sync':             ARP_SYNC,
+        'instruments':          [inp['instrument_str'] for inp in inputs],
+    }
+
+def control_values(request):
+    """
+    Check a control request over and turn it into {global name: new value}... the scale itself is
+    left for reconfigure(), since music21 is slow. Anything wrong is a ValueError.
+    """
+    values  = {}
+    unknown = set(request) - set(CONTROL_FIELDS)
+
+    if unknown:
+        raise ValueError(f"don't know how to change {', '.join(sorted(unknown))}")
+
+    if 'key' in request:
+        key = request['key']
+        if not isinstance(key, str) or not key or key[0].upper() not in NOTE_LETTER_OFFSETS or not all(c in '#b-' for c in key[1:]):
+            raise ValueError(f"bad key {key!r}, try something like C, F# or Bb")
+        values['KEY_NAME']   = key
+        values['KEY_OFFSET'] = calculate_key_offset(key)
+
+    if 'scale' in request:
+        name = request['scale']
+        if name is not None and (not isinstance(name, str) or name in ("help", "list") or
+                                 ('-' not in name and len(match_scale_names(name)) != 1)):
+            raise ValueError(f"no such scale {name!r} (or it could be more than one)")
+        values['SCALE_NAME'] = name
+
+    if 'only_scale_permitted' in request:
+        values['ONLY_SCALE_PERMITTED'] = bool(request['only_scale_permitted'])
+
+    if 'mode' in request:
+        if request['mode'] not in ("chords", "notes"):
+            raise ValueError("mode is chords or notes")
+        values['CHORDS'] = request['mode'] == "chords"
+
+    if 'arp' in request:
+        values['ARP'] = bool(request['arp'])
+
+    if 'arp_pattern' in request:
+        if not isinstance(request['arp_pattern'], str):
+            raise ValueError("arp_pattern is a string, like +1.+2.+3.+4.")
+        values['ARP_PATTERN'] = request['arp_pattern']
+
+    if 'arp_direction' in request:
+        if request['arp_direction'] not in ARP_DIRECTIONS:
+            raise ValueError(f"arp_direction is one of {', '.join(ARP_DIRECTIONS)}")
+        values['ARP_DIRECTION'] = request['arp_direction']
+
+    if 'arp_bpm' in request:
+        bpm = request['arp_bpm']
+        if isinstance(bpm, bool) or not isinstance(bpm, (int, float)) or bpm <= 0:
+            raise ValueError("arp_bpm is a number, more than 0")
+        values['ARP_BPM'] = bpm
+
+    if 'arp_rate' in request:
+        try:
+            rate = fractions.Fraction(str(request['arp_rate']))
+        except (ValueError, ZeroDivisionError):
+            rate = 0
+        if rate <= 0:
+            raise ValueError("arp_rate is a fraction, like 1/4")
+        values['ARP_RATE'] = rate
+
+    if 'arp_phase' in request:
+        try:
+            phase = fractions.Fraction(str(request['arp_phase']))
+        except (ValueError, ZeroDivisionError):
+            phase = -1
+        if not 0 <= phase < 1:
+            raise ValueError("arp_phase is a fraction of a step, from 0 up to (not including) 1, like 1/2")
+        values['ARP_PHASE'] = phase
+
+    if 'arp_sync' in request:
+        values['ARP_SYNC'] = bool(request['arp_sync'])
+
+    return values
+
+def control_instrument(request):
+    """A control request's instrument, as (input, bank, program, name), or None if it hasn't got one"""
+    if 'instrument' not in request:
+        return None
+
+    port = request.get('input', 0)
+    if isinstance(port, bool) or not isinstance(port, int) or not 0 <= port < len(inputs):
+        raise ValueError(f"input is 0 to {len(inputs) - 1}")
+
+    arg = str(request['instrument'])
+    if arg.isdigit():
+        bank, program, name = resolve_instrument(arg)
+    else:
+        # resolve_instrument() would bail on a name it can't pin down, no good here
+        presets = load_sf2_index(SF2) or [(0, i, name) for i, name in enumerate(INSTRUMENTS)]
+        matches = match_instruments(arg, presets)
+        if len(matches) != 1:
+            raise ValueError(f"instrument {arg!r} is {'any of ' + ', '.join(m[2] for m in matches) if matches else 'nowhere to be found'}")
+        bank, program, name = matches[0]
+
+    if not 0 <= program < 128:
+        raise ValueError(f"instrument {arg!r} is out of range")
+
+    return port, bank, program, name
+
+async def build_sliced(rows, values):
+    """Build a table from a row generator with the new settings, a few rows at a time so the inputs don't wait"""
+    table = []
+
+    while True:
+        with swapped_globals(values):
+            chunk = list(itertools.islice(rows, CONTROL_SLICE))
+
+        if not chunk:
+            return table
+
+        table.extend(chunk)
+        await asyncio.sleep(0)
+
+async def reconfigure(request):
+    """
+    Change settings on the fly... only the tables the change touches get rebuilt, and nothing
+    changes over until they all have. Returns what to answer with.
+    """
+    global chord_table, arp_pattern, arp_steps
+
+    t0         = time.perf_counter()
+    values     = control_values(request)
+    instrument = control_instrument(request)
+    now        = {name: globals()[name] for name in ('KEY_NAME', 'SCALE_NAME', 'ONLY_SCALE_PERMITTED', 'CHORDS', 'ARP')}
+    new        = {**now, **values}
+
+    # a new scale, or the old one in a new key... music21 takes its time, off it goes to a thread
+    if new['SCALE_NAME'] != now['SCALE_NAME'] or new['SCALE_NAME'] and new['KEY_NAME'] != now['KEY_NAME']:
+        made = None
+        if new['SCALE_NAME']:
+            made = await asyncio.get_running_loop().run_in_executor(None, make_scale, new['SCALE_NAME'], new['KEY_NAME'])
+            if made is None:
+                raise ValueError(f"couldn't make a {new['KEY_NAME']} {new['SCALE_NAME']} scale")
+
+        current, obj, midi_notes = made or (None, None, None)
+        values.update(current_scale=current, current_scale_obj=obj, scale_notes_midi=midi_notes)
+        values.update(scale_tables(midi_notes))
+
+    if new['ONLY_SCALE_PERMITTED'] and not values.get('scale_notes_midi', scale_notes_midi) and {'ONLY_SCALE_PERMITTED', 'SCALE_NAME'} & set(values):
+        raise ValueError("only_scale_permitted needs a scale")
+
+    # chords in a new key get voiced with music21's help, wake it up in the background too
+    if 'KEY_OFFSET' in values and pitch is None:
+        await asyncio.get_running_loop().run_in_executor(None, load_music21)
+
+    # what the tables are built from... the BPM, rate and phase are read as they're used
+    touched     = set(values) & {'KEY_OFFSET', 'scale_notes_midi', 'ONLY_SCALE_PERMITTED'}
+    new_chords  = None
+    new_arp     = None
+
+    if new['CHORDS'] and (touched or not now['CHORDS']):
+        new_chords = await build_sliced(chord_rows(), values)
+
+    if new['ARP'] and (touched or not now['ARP'] or {'ARP_PATTERN', 'ARP_DIRECTION'} & set(values)):
+        with swapped_globals(values):
+            pattern = arp_pattern_elements()
+        rows    = await build_sliced(arp_rows(pattern), values)
+        new_arp = pattern, {1: rows[:128], -1: rows[128:]}
+
+    # ... and all change over at once, in between events
+    if new['ARP'] != now['ARP']:
+        # whatever was going in the old mode wouldn't get let go of in the new one
+        all_voices_off()
+
+    globals().update(values)
+
+    if new_chords is not None:
+        chord_table = new_chords
+
+    if new_arp is not None:
+        arp_pattern, arp_steps = new_arp
+
+        # running arps carry on where they were, with the new steps
+        for arp_data in active_arps.values():
+            arp_data['steps']      = arp_steps[1][arp_data['base_note']]
+            arp_data['steps_down'] = arp_steps[-1][arp_data['base_note']]
+            arp_data['step']      %= len(arp_data['steps'])
+
+    # the running arps keep the rate they started with (see start_arp()), a new one's for the next
+    # ones... a new BPM they all pick up from their next step, and the beat grid keeps counting
+    if 'ARP_BPM' in values:
+        anchor_arp_grid(arp_time())
+
+    if instrument:
+        port, bank, program, name = instrument
+        inp = inputs[port]
+        inp.update(bank=bank, instrument_int=program, instrument_str=name)
+
+        # its own channel again, rather than whatever preset it was pointed at
+        channel_layers.pop(inp['channel'], None)
+        setup_instrument(program, name, inp['channel'], bank)
+        apply_gain(inp['channel'])
+
+    logging.warning(f"reconfigured {', '.join(sorted(request))} in {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    return {'ok': True, 'settings': current_settings()}
+
+async def control_server(path):
+    """Listen on a Unix socket for reconfigure() requests, one at a time"""
+    lock = asyncio.Lock()
+
+    async def client(reader, writer):
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+
+                async with lock:
+                    reply = await reconfigure(request)
+            except ValueError as e:
+                reply = {'ok': False, 'error': str(e)}
+            except Exception as e:
+                logging.error(f"control request {line!r} went wrong: {e}")
+                reply = {'ok': False, 'error': str(e)}
+
+            writer.write(json.dumps(reply).encode() + b'\n')
+            await writer.drain()
+
+        writer.close()
+
+    # left over from last time?
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+    server = await asyncio.start_unix_server(client, path)
+    os.chmod(path, 0o600)
+    logging.warning(f"taking requests on {path}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+#
+# --metrics-port... counters and gauges in Prometheus' text format, on localhost. Scrapes get
+# served on a thread of their own and only read what the engine's counting anyway, so they never
+# hold the engine up (or the other way 'round)
+#
+def resident_memory():
+    """Our RSS in bytes, or None without a /proc to ask (macOS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def metrics_text():
+    """Everything there is to know, as a Prometheus scrape"""
+    lines = []
+
+    # each sample's (labels, value)... a summary's are (_sum or _count, value)
+    def metric(name, kind, help, *samples):
+        lines.append(f"# HELP noize_{name} {help}")
+        lines.append(f"# TYPE noize_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"noize_{name}{labels} {value}")
+
+    stats = voice_stats()
+    clock = dict(arp_clock)
+
+    metric("messages_total", "counter", "Midi messages handled, by type",
+           *((f'{{type="{kind}"}}', count) for kind, count in sorted(dict(message_counts).items())))
+    metric("notes_started_total", "counter", "Notes started", ("", stats['started']))
+    metric("notes_stopped_total", "counter", "Notes stopped", ("", stats['stopped']))
+    metric("notes_stolen_total", "counter", "Notes stolen to stay under --max-voices", ("", stats['stolen']))
+    metric("voices", "gauge", "Notes sounding", ("", stats['sounding']))
+    metric("voices_peak", "gauge", "Most notes sounding at once", ("", stats['peak']))
+
+    if 'synth' in stats:
+        metric("synth_voices", "gauge", "Voices fluidsynth has going", ("", stats['synth']))
+
+    metric("active_arps", "gauge", "Arpeggios going", ("", len(active_arps)))
+    metric("arp_ticks_total", "counter", "Arp steps played (or rested)", ("", clock['ticks']))
+    metric("arp_ticks_skipped_total", "counter", "Arp steps skipped for being more than a step behind", ("", clock['skipped']))
+    metric("arp_tick_lateness_seconds", "summary", "How late arp steps are",
+           ("_sum", clock['late_sum']), ("_count", clock['ticks']))
+    metric("arp_tick_lateness_seconds_max", "gauge", "Latest an arp step has been", ("", clock['late_max']))
+
+    metric("cc_coalesced_total", "counter", "Control changes overtaken by a newer value before they were applied",
+           ('{stage="engine"}', cc_counts['coalesced']),
+           *((f'{{stage="input",input="{port}"}}', inp['queue'].coalesced) for port, inp in enumerate(inputs)))
+    metric("cc_applied_total", "counter", "Control changes applied", ("", cc_counts['applied']))
+    metric("dropped_total", "counter", "Messages dropped with an input's queue full",
+           *((f'{{input="{port}"}}', inp['queue'].dropped) for port, inp in enumerate(inputs)))
+
+    rss = resident_memory()
+    if rss is not None:
+        metric("resident_memory_bytes", "gauge", "Resident set size", ("", rss))
+
+    return "\n".join(lines) + "\n"
+
+def start_metrics_server(port):
+    """Serve metrics_text() at http://127.0.0.1:port/metrics from a thread, returns the server (to shutdown())"""
+    import http.server      # only when asked for, it's not that cheap an import
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.partition('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+
+            body = metrics_text().encode()
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("metrics: " + format, *args)
+
+    try:
+        server = http.server.HTTPServer(('127.0.0.1', port), MetricsHandler)
+    except OSError as e:
+        logging.error(f"can't serve metrics on port {port}: {e}")
+        sys.exit(1)
+
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.warning(f"metrics at http://127.0.0.1:{port}/metrics")
+
+    return server
+
+#
+# --profile... a sampling profiler that rides along for the whole session. Every PROFILE_INTERVAL
+# it has a look at what each thread (the event loop, the midi backend's callbacks, etc.) is up to,
+# and on the way out writes PREFIX.collapsed (one "thread;outer;...;inner count" line per stack,
+# for flamegraph.pl, speedscope and friends) and PREFIX.txt, the functions by time spent
+#
+class Profiler:
+    """Samples every thread's stack from a thread of its own, nothing to do for the ones being sampled"""
+
+    # a thread sitting in one of these is waiting for something to do
+    IDLE = {('selectors.py', 'select'), ('threading.py', 'wait'), ('queue.py', 'get')}
+
+    def __init__(self, prefix, interval=PROFILE_INTERVAL):
+        self.prefix   = prefix
+        self.interval = interval
+
+        self.stacks   = collections.Counter()   # (thread, outermost frame, ..., innermost) -> samples
+        self.idle     = collections.Counter()   # thread -> samples spent waiting
+        self.labels   = {}                      # code object -> "function (file:line)"
+        self.ticks    = 0
+        self.t0       = time.perf_counter()
+
+        self.stopping = threading.Event()
+        self.thread   = threading.Thread(target=self.run, name="profiler", daemon=True)
+
+    def start(self):
+        # the sampler needs the GIL to look, and a busy thread only hands it over every switch
+        # interval (5ms)... left at that, short bursts of work (a pad hit) would hardly ever get
+        # sampled. A busy thread only gets asked once a tick, so it's cheap to ask a lot sooner...
+        # but it does change how the threads being measured take turns, 'til stop() puts it back
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 10))
+
+        self.thread.start()
+        logging.warning(f"profiling every {self.interval * 1000:g}ms, to {self.prefix}.collapsed and {self.prefix}.txt on the way out")
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def run(self):
+        me = threading.get_ident()
+
+        while not self.stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.ticks += 1
+
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+
+                name = names.get(ident, f"thread-{ident}")
+                code = frame.f_code
+
+                if (os.path.basename(code.co_filename), code.co_name) in self.IDLE:
+                    self.idle[name] += 1
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(self.label(frame.f_code))
+                    frame = frame.f_back
+
+                stack.append(name)
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        """Stop sampling and write it all out"""
+        if self.stopping.is_set():
+            return
+
+        self.stopping.set()
+        self.thread.join()
+
+        sys.setswitchinterval(self.switch_interval)
+
+        busy    = sum(self.stacks.values())
+        elapsed = time.perf_counter() - self.t0
+
+        with open(f"{self.prefix}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+        # self is where the sample was taken, total is anywhere in the stack (once, for recursion)
+        own   = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+
+        with open(f"{self.prefix}.txt", "w") as f:
+            f.write(f"{self.ticks} ticks over {elapsed:.1f}s (every {self.interval * 1000:g}ms), {busy} busy samples, "
+                    f"idle: {', '.join(f'{name} {count}' for name, count in self.idle.most_common()) or 'never'}\n\n")
+            f.write(f"{'self':>7} {'self%':>6} {'total':>7} {'total%':>6}  function\n")
+            for label, count in total.most_common():
+                f.write(f"{own[label]:7} {own[label] / busy * 100:6.1f} {count:7} {count / busy * 100:6.1f}  {label}\n")
+
+        logging.warning(f"profile: {busy} busy samples written to {self.prefix}.collapsed and {self.prefix}.txt")
+
+#
+# headless benchmarking
+#
+class CountingSynth:
+    """Stands in for the pyfluidsynth Synth for --bench, counting calls rather than making any noise"""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+
+    def noteon(self, chan, key, vel):
+        self.calls['noteon'] += 1
+
+    def noteoff(self, chan, key):
+        self.calls['noteoff'] += 1
+
+    def cc(self, chan, ctrl, val):
+        self.calls['cc'] += 1
+
+    def program_select(self, chan, sfid, bank, preset):
+        self.calls['program_select'] += 1
+
+def synthetic_stream(hits=2000):
+    """Pad hits across the NMVSE's octave, with the knob getting swept every so often"""
+    messages = []
+
+    for i in range(hits):
+        note = 60 + (i * 5) % 13
+        messages.append(mido.Message('note_on',  note=note, velocity=100))
+        messages.append(mido.Message('note_off', note=note))
+
+        if i % 10 == 0:
+            for value in range(0, 128, 8):
+                messages.append(mido.Message('control_change', control=7, value=value))
+
+    return messages
+
+def recorded_stream(filename):
+    """The note/CC messages from a recorded session or a MIDI file"""
+    with open(filename, 'rb') as f:
+        is_session = f.read(len(SESSION_MAGIC)) == SESSION_MAGIC
+
+    if is_session:
+        messages = [msg for t, port, msg in read_session(filename)]
+    else:
+        messages = list(mido.MidiFile(filename))
+
+    return [msg for msg in messages if msg.type in ('note_on', 'note_off', 'control_change')]
+
+def bench_run(messages):
+    """Push messages through the queue and handlers like the engine would, an arp step's worth of time per message"""
+    global cc_next_due, arp_time
+
+    queue    = EventQueue(ENGINE_QUEUE_SIZE)
+    now      = 0.0
+    arp_time = lambda: now
+
+    # every run starts with the knobs untouched
+    cc_applied.clear()
+    cc_next_due = 0.0
+
+    for msg in messages:
+        queue.put(msg.copy())
+        queue.drain(handle_message)
+        flush_controls()
+
+        if ARP:
+            run_due_arps(now)
+            now += arp_period(ARP_RATE)
+
+    # and ends up exactly where the knobs were left
+    flush_controls(force=True)
+
+def run_bench(source):
+    """
+    Feed a synthetic (or recorded, if source is a session or MIDI file) stream of notes and CCs through
+    the real message handling for each mode, into a synth that just counts calls, and report
+    how fast it went. No device, no fluidsynth, no audio needed.
+    """
+    global synth, ARP, CHORDS, ONLY_SCALE_PERMITTED, KEY_OFFSET
+    global current_scale, current_scale_obj, scale_notes_midi
+
+    load_mido()
+
+    messages   = recorded_stream(source) if source else synthetic_stream()
+    synth      = CountingSynth()
+    user_scale = args.scale or "major"
+
+    # the chatter would swamp the numbers
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"Benchmarking {len(messages)} events from {source or 'a synthetic stream'}")
+    print("=" * 100)
+    print(f"{'mode':7} {'variant':28} | {'events/s':>10} {'CPU us/event':>12} {'retained B/event':>16} {'peak KiB':>9} | synth calls")
+
+    for mode in ("chords", "notes", "arp"):
+        for variant in ("key of C", f"--only-scale-permitted {user_scale}", "key of F#"):
+            ARP    = mode == "arp"
+            CHORDS = mode != "notes"
+
+            current_scale = current_scale_obj = scale_notes_midi = None
+            compile_scale_tables()
+            ONLY_SCALE_PERMITTED = variant.startswith("--only-scale-permitted")
+            KEY_OFFSET           = calculate_key_offset("F#" if variant.endswith("F#") else "C")
+
+            if ONLY_SCALE_PERMITTED:
+                setup_scale(user_scale, "C")
+
+            rebuild_derived_tables()
+            active_arps.clear()
+            arp_heap.clear()
+            active_voices.clear()
+            voices.clear()
+            synth.calls.clear()
+
+            # timing pass
+            wall = time.perf_counter()
+            cpu  = time.process_time()
+            bench_run(messages)
+            cpu  = time.process_time() - cpu
+            wall = time.perf_counter() - wall
+
+            calls = dict(synth.calls)
+            active_arps.clear()
+            arp_heap.clear()
+            active_voices.clear()
+            voices.clear()
+
+            # allocation pass, separately since tracemalloc slows everything down
+            tracemalloc.start()
+            bench_run(messages)
+            # what's still held at the end (not everything allocated along the way), and the high water mark
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            active_arps.clear()
+            arp_heap.clear()
+            active_voices.clear()
+            voices.clear()
+
+            print(f"{mode:7} {variant:28} | {len(messages) / wall:10.0f} {cpu / len(messages) * 1e6:12.2f} "
+                  f"{retained / len(messages):16.2f} {peak / 1024:9.1f} | {' '.join(f'{k}={v}' for k, v in sorted(calls.items()))}")
+
+#
+# session recording and replay
+#
+# A session file is a header followed by fixed-size records, one per message that came in:
+# nanoseconds since the start of the session (monotonic), which input it came in on, and
+# the message's bytes (up to 3 - sysex isn't recorded). Small enough for hour-long
+# sessions, and fixed-size records means it can be mmap'd and walked without parsing.
+#
+SESSION_MAGIC   = b'NMVSEREC'
+SESSION_HEADER  = struct.Struct('<8sII')     # magic, version, record size
+SESSION_RECORD  = struct.Struct('<qBB3s4x')  # t (ns), port, length, data
+SESSION_VERSION = 1
+
+class SessionRecorder:
+    """
+    Appends everything that comes in from the controller to a session file.
+
+    record() is on the midi backend's thread, right behind the note on its way to the engine, so
+    it only packs the record onto a deque (appending's atomic, no lock). A background thread
+    writes out whatever's piled up and flushes it every interval, so the disk never gets in the
+    way of a note, and a crash only takes the last interval's worth with it.
+    """
+
+    def __init__(self, filename, interval=0.1):
+        # never over an old session
+        try:
+            self.file = open(filename, 'xb')
+        except FileExistsError:
+            logging.error(f"{filename} is already there, not recording over it")
+            sys.exit(1)
+
+        self.t0       = time.monotonic_ns()
+        self.skipped  = 0
+        self.pending  = collections.deque()
+        self.interval = interval
+        self.stopping = threading.Event()
+
+        self.file.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, SESSION_RECORD.size))
+
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+        logging.warning(f"recording session to {filename}")
+
+    def record(self, data, port=0):
+        """data is the message's bytes, as it came in"""
+        if len(data) > 3:
+            self.skipped += 1
+            return
+
+        self.pending.append(SESSION_RECORD.pack(time.monotonic_ns() - self.t0, port, len(data), data))
+
+    def write_out(self):
+        records = []
+        while self.pending:
+            records.append(self.pending.popleft())
 
-    logging.debug(f"ARP SEQUENCE: {sequence}")
-    logging.info(f"Arp sequence for note {number_to_note(note)[0]}{number_to_note(note)[1]}: {' '.join(sequence)}")
-    logging.info(f"Playing at rate: {ARP_RATE} notes per beat ({ARP_BPM} BPM)")
-    
-    # Create a new arpeggio entry
-    with arp_lock:
-        note_id = f"{channel}:{note}"
-        active_arps[note_id] = {
-            'base_note': note,
-            'pattern': pattern,
-            'step': 0,
-            'active': True,
-            'current_note': None
-        }
-    
-    # Start the arp
+        if records:
+            self.file.write(b''.join(records))
+            self.file.flush()
 
-def stop_arp(channel, note):
-    global active_arps
-    
-    if not ARP:
-        logging.warning("hey, ARP isn't enabled, bailing from stop_arp()")
-        return
-    
-    with arp_lock:
-        note_id = f"{channel}:{note}"
-        if note_id in active_arps:
-            # Mark as inactive (will be removed in the loop if not overlayed)
-            active_arps[note_id]['active'] = False
-            
-            # If not overlayed, stop the current note
-            if not ARP_OVERLAY and active_arps[note_id]['current_note'] is not None:
-                fluidsynth.stop_Note(active_arps[note_id]['current_note'])
-                active_arps[note_id]['current_note'] = None
-    
-    logging.debug(f"Stopped arpeggio for note {note}")
+    def writer(self):
+        while not self.stopping.wait(self.interval):
+            self.write_out()
 
-def stop_sound(chan, note):
-    global midi_player
+    def close(self):
+        self.stopping.set()
+        self.thread.join()
 
-    logging.warning("\tstop!")
-    
-    # If scale restriction is enabled, map the key to the scale sequentially
-    if ONLY_SCALE_PERMITTED:
-        original_note = note
-        note = map_midi_key_to_scale(note)
-        if original_note != note:
-            logging.debug(f"Mapped key {original_note} to scale note {note} for stop")
-    
-    note_str, octave = number_to_note(note)
+        # whatever came in since the last go
+        self.write_out()
+        self.file.close()
 
-    logging.debug("\t<--- [channel: %s] %s/%s [midi-num: %s]" % (chan, note_str, octave, note))
+        if self.skipped:
+            logging.warning(f"session recording skipped {self.skipped} sysex messages")
 
-    _note, _octave = number_to_note(note)
+def read_session(filename):
+    """Yields (t in ns, port, message) for each record in a session file"""
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, record_size = SESSION_HEADER.unpack_from(mm)
 
-    # stop arpy mcArpems
-    if ARP:
-        # slam on the bräx
-        if not ARP_LATCH:
-            stop_arp(chan, note)
+        if magic != SESSION_MAGIC or version != SESSION_VERSION or record_size != SESSION_RECORD.size:
+            raise ValueError(f"{filename} isn't a (version {SESSION_VERSION}) session recording")
 
-    # bye bye love
-    elif CHORDS:
-        # For chords, we need to transpose the root note before getting the chord
-        if KEY_OFFSET != 0:
-            # Get the transposed root note
-            transposed_note_str = transpose_note(note_str, KEY_OFFSET)
-            notez = chords.from_shorthand(transposed_note_str)
-        else:
-            notez = chords.from_shorthand(note_str)
-    
-        logging.debug(notez)
-    
-        last_note = 0
-        for nz in notez:
-            z = note_to_number(nz, _octave)
-    
-            if last_note > z:
-                z = z + NOTES_IN_OCTAVE
-            
-            # If scale restriction is enabled, map chord notes to the scale
-            if ONLY_SCALE_PERMITTED:
-                original_z = z
-                z = map_to_scale(z)
-                if original_z != z:
-                    logging.debug(f"Mapped chord note {original_z} to {z} (in scale)")
-    
-            fluidsynth.stop_Note(z)
-    
-            last_note = note
-    
-    # no no note
-    else:
-        # Apply key transposition for direct note playing
-        if KEY_OFFSET != 0:
-            transposed_note = note + KEY_OFFSET
-            fluidsynth.stop_Note(transposed_note)
-        else:
-            fluidsynth.stop_Note(note)
+        # a recording cut short might end in part of a record
+        body = memoryview(mm)[SESSION_HEADER.size:]
+        body = body[:len(body) - len(body) % SESSION_RECORD.size]
+
+        try:
+            for t, port, length, data in SESSION_RECORD.iter_unpack(body):
+                yield t, port, mido.Message.from_bytes(data[:length])
+        finally:
+            body.release()
+
+async def replay_session(filename, speed=1.0):
+    """
+    Yields (port, message) from a session file as if they were coming in live, at the
+    recorded pace divided by speed (0 for as fast as possible)
+    """
+    start = time.monotonic_ns()
+
+    for t, port, msg in read_session(filename):
+        if speed:
+            wait = (start + t / speed - time.monotonic_ns()) / 1e9
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        yield port, msg
+
+#
+# offline rendering
+#
+def render_midi(midi_file, wav_file):
+    """
+    Play a MIDI file through the same handling as live input (key offset, scale, chords,
+    arp at ARP_BPM) into a WAV file, as fast as the CPU allows. The arp ticks on the
+    rendered audio's clock rather than the wall clock.
+    """
+    load_mido()
+
+    logging.warning(f"rendering {midi_file} to {wav_file}")
+
+    global arp_time
+
+    block    = RENDER_BLOCK
+    buf      = ctypes.create_string_buffer(block * 4)
+    written  = 0
+    t        = 0.0
+    arp_time = lambda: t
+    wall     = time.perf_counter()
+
+    wav = wave.open(wav_file, 'wb')
+    wav.setnchannels(2)
+    wav.setsampwidth(2)
+    wav.setframerate(RENDER_SAMPLE_RATE)
+
+    def render_until(until):
+        nonlocal written
+
+        target = int(until * RENDER_SAMPLE_RATE)
+        while written < target:
+            frames = min(block, target - written)
+            # interleaved 16 bit stereo: left at 0, right at 1, every 2 samples
+            pyfluid.fluid_synth_write_s16(synth.synth, frames, buf, 0, 2, buf, 1, 2)
+            wav.writeframesraw(buf.raw[:frames * 4])
+            written += frames
+
+    def run_arp_until(until):
+        while (due := next_arp_due()) is not None and due <= until:
+            render_until(due)
+            run_due_arps(due)
+
+    for msg in mido.MidiFile(midi_file):
+        t += msg.time
+
+        run_arp_until(t)
+        render_until(t)
+
+        if msg.type in ('note_on', 'note_off', 'control_change'):
+            # everything plays as the first input
+            msg.channel = inputs[0]['channel']
+            handle_message(msg)
+            flush_controls(t)
+
+    # give any arps a beat to finish up, then everything off and let it ring out
+    flush_controls(t, force=True)
+    run_arp_until(t + 60.0 / ARP_BPM)
+    all_voices_off()
+
+    render_until(t + 60.0 / ARP_BPM + RENDER_TAIL)
+    wav.close()
+
+    wall  = time.perf_counter() - wall
+    audio = written / RENDER_SAMPLE_RATE
+
+    print(f"Rendered {audio:.1f}s of audio in {wall:.2f}s - {audio / wall:.1f}x realtime")
 
 def get_midi_out_devices():
     logging.debug("getting midi output devices...")
@@ -1061,8 +2987,247 @@ def get_midi_out_devices():
         if output:
             logging.info( "%2i: %s [%s]" % (i, name.decode("utf-8"), interf.decode("utf-8")))
 
-def instrument_string_search(arg):
-    inst = [i for i,v in enumerate(INSTRUMENTS) if v.lower() == arg.lower()]
+#
+# what's in a sound font... just the preset headers, read straight out of the file
+#
+def read_sf2_presets(path):
+    """
+    [(bank, program, name)] from an SF2's pdta/phdr chunk. The file's mmapped and the chunks
+    are hopped over by their sizes, so the samples (nearly all of it) are never read.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        riff, size = SF2_CHUNK.unpack_from(mm, 0)
+
+        if riff != b'RIFF' or mm[8:12] != b'sfbk':
+            raise ValueError(f"{path} isn't an SF2 file")
+
+        end = min(len(mm), 8 + size)
+        pos = 12
+
+        while pos + SF2_CHUNK.size <= end:
+            chunk, size = SF2_CHUNK.unpack_from(mm, pos)
+
+            if chunk == b'LIST' and mm[pos + 8:pos + 12] == b'pdta':
+                sub     = pos + 12
+                sub_end = min(end, pos + 8 + size)
+
+                while sub + SF2_CHUNK.size <= sub_end:
+                    chunk, size = SF2_CHUNK.unpack_from(mm, sub)
+
+                    if chunk == b'phdr':
+                        data    = mm[sub + 8:sub + 8 + size - size % SF2_PHDR.size]
+                        presets = [(bank, program, name.split(b'\0', 1)[0].decode('latin-1').strip())
+                                   for name, program, bank in SF2_PHDR.iter_unpack(data)]
+
+                        # the last one's the EOP terminator
+                        return sorted(presets[:-1])
+
+                    # chunks are padded to an even length
+                    sub += SF2_CHUNK.size + size + (size & 1)
+
+            pos += SF2_CHUNK.size + size + (size & 1)
+
+    raise ValueError(f"no preset headers in {path}")
+
+def load_sf2_index(path):
+    """
+    The presets in an SF2, from the cache if the file's path, mtime and size match what's there,
+    otherwise read from the file (and cached). None if it can't be read at all.
+    """
+    path = os.path.realpath(path)
+
+    if path in sf2_indexes:
+        return sf2_indexes[path]
+
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        logging.debug(f"can't index {path}: {e}")
+        return None
+
+    cache_file = os.path.join(CACHE_DIR, "sf2-presets.json")
+    key        = { 'mtime': stat.st_mtime_ns, 'size': stat.st_size }
+
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        cached = {}
+
+    entry = cached.get(path)
+    if isinstance(entry, dict) and entry.get('mtime') == key['mtime'] and entry.get('size') == key['size']:
+        logging.debug(f"read {path}'s presets from {cache_file}")
+        sf2_indexes[path] = [tuple(preset) for preset in entry['presets']]
+        return sf2_indexes[path]
+
+    try:
+        presets = read_sf2_presets(path)
+    except (OSError, ValueError, struct.error) as e:
+        logging.warning(f"couldn't read the presets in {path}: {e}")
+        return None
+
+    sf2_indexes[path] = presets
+
+    # write it out atomically-ish, a failure here just means we read the file again next time
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        cached[path] = dict(key, presets=presets)
+        tmp_file = f"{cache_file}.{os.getpid()}"
+        with open(tmp_file, 'w') as f:
+            json.dump(cached, f)
+        os.replace(tmp_file, cache_file)
+        logging.debug(f"wrote {path}'s presets to {cache_file}")
+    except OSError as e:
+        logging.debug(f"couldn't write {cache_file}: {e}")
+
+    return presets
+
+def list_instruments():
+    """Everything in the sound font, or the General MIDI set if we can't read it"""
+    presets = load_sf2_index(SF2)
+
+    if presets is None:
+        logging.warning(f"can't read {SF2}, these are the General MIDI instruments")
+        presets = [(0, i, name) for i, name in enumerate(INSTRUMENTS)]
+
+    for bank, program, name in presets:
+        print(f"{bank:3}:{program:<3} {name}")
+
+def resolve_instrument(arg):
+    """-i/--input's instrument, a number or a name (from whatever SF2 we've got)... returns (bank, program, name)"""
+    presets = load_sf2_index(SF2)
+
+    # can't read the sound font? The General MIDI names will have to do
+    if presets is None:
+        presets = [(0, i, name) for i, name in enumerate(INSTRUMENTS)]
+
+    # choose/defaults to an integer for an instrument (in bank 0), look up the name
+    if arg.isdigit():
+        name = next((name for bank, program, name in presets if bank == 0 and program == int(arg)), arg)
+        return 0, int(arg), name
+
+    # if you tried an instrument on its name, see if we can find it
+    return instrument_string_search(arg, presets)
+
+def make_input(port, spec):
+    """An --input, 'PATTERN' or 'PATTERN@INSTRUMENT' (-i's instrument if there isn't one)"""
+    if port >= len(INPUT_CHANNELS):
+        logging.error(f"Too many inputs, there are only {len(INPUT_CHANNELS)} synth channels to go around")
+        sys.exit(1)
+
+    pattern, _, instrument = spec.partition('@')
+    bank, instrument_int, instrument_str = resolve_instrument(instrument or args.instrument)
+
+    return {
+        'pattern':        pattern,
+        'name':           None,
+        'channel':        INPUT_CHANNELS[port],
+        'instrument_int': instrument_int,
+        'instrument_str': instrument_str,
+        'bank':           bank,
+        'queue':          EventQueue(ENGINE_QUEUE_SIZE, wake_engine),
+        'midi':           None,
+    }
+
+def attach_input(port, names):
+    """Open the first midi input in names matching an input's pattern (that no other input has), True if it did"""
+    inp   = inputs[port]
+    taken = {other['name'] for other in inputs if other['midi'] is not None}
+    name  = next((name for name in names if name.startswith(inp['pattern']) and name not in taken), None)
+
+    if name is None:
+        return False
+
+    try:
+        # the midi backend calls deliver() for each message as it comes in, no reader of our own per device
+        inp['midi'] = mido.open_input(name, callback=lambda msg, port=port: deliver(port, msg))
+    except Exception as e:
+        logging.error(f"couldn't open {name}: {e}")
+        return False
+
+    inp['name'] = name
+    logging.warning(f"Listening for input from {name} on channel {inp['channel']}")
+    return True
+
+def detach_input(port):
+    """An input's gone away... close it up and let go of whatever it left sounding"""
+    inp = inputs[port]
+
+    logging.warning(f"lost {inp['name']}... its notes are off, and we'll keep an eye out for it")
+
+    try:
+        inp['midi'].close()
+    except Exception as e:
+        logging.debug(f"closing {inp['name']}: {e}")
+    inp['midi'] = None
+
+    # anything it got in before it went, then all its voices off
+    inp['queue'].drain(handle_message)
+    all_voices_off(inp['channel'])
+
+async def watch_inputs():
+    """
+    Hot-plug... attach inputs as they show up and detach them when they go, the synth and its
+    sound font stay loaded the whole time. Missing inputs are looked for with a backoff, the
+    ones that are there get checked on every WATCH_INTERVAL.
+    """
+    loop    = asyncio.get_running_loop()
+    backoff = WATCH_BACKOFF[0]
+
+    while True:
+        # asking the midi backend blocks (rtmidi opens a whole new client each time), so it's
+        # done off the loop... only the attaching and detaching happens on it
+        names = await loop.run_in_executor(None, mido.get_input_names)
+
+        for port, inp in enumerate(inputs):
+            if inp['midi'] is not None and inp['name'] not in names:
+                detach_input(port)
+
+        for port, inp in enumerate(inputs):
+            if inp['midi'] is None and attach_input(port, names):
+                backoff = WATCH_BACKOFF[0]
+
+        if all(inp['midi'] is not None for inp in inputs):
+            await asyncio.sleep(WATCH_INTERVAL)
+        else:
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, WATCH_BACKOFF[1])
+
+def deliver(port, msg):
+    """
+    Everything from an input comes through here, on whatever thread the midi backend calls back
+    on... it gets moved over to the input's synth channel and queued for the engine, and only
+    then recorded (as it came in), so the recording's never in the way of the note
+    """
+    data = msg.bin() if recorder else None
+
+    # a session recorded with more inputs than we've got... the extras pile onto the last
+    inp = inputs[min(port, len(inputs) - 1)]
+
+    if hasattr(msg, 'channel'):
+        msg.channel = inp['channel']
+
+    inp['queue'].put(msg)
+
+    if recorder:
+        recorder.record(data, port)
+
+def match_instruments(arg, presets):
+    """The (first) preset named arg, or if there isn't one, all the ones with it in their name"""
+    inst = [preset for preset in presets if preset[2].lower() == arg.lower()]
+
+    if inst:
+        return inst[:1]
+
+    return [preset for preset in presets if arg.lower() in preset[2].lower()]
+
+def instrument_string_search(arg, presets):
+    inst = match_instruments(arg, presets)
+
+    # nothing by that exact name? Something with it in the name, if there's only the one
+    if len(inst) > 1:
+        logging.error(f"Instrument {arg} could be any of: {', '.join(name for bank, program, name in inst)}")
+        sys.exit(33)
 
     if not inst:
         logging.error(f"Couldn't find instrument {arg}")
@@ -1071,20 +3236,39 @@ def instrument_string_search(arg):
         logging.debug(f"instrument {arg} == {inst}")
         return inst[0]
 
-def signal_handler(sig, frame):
-    logging.error("caught interrupt signal... shutting down....")
+# kill -USR1 for a look at what's going on, see run_live()
+def usr1_handler():
+    if args.event_dump:
+        event_log.dump(args.event_dump)
+    voice_report()
 
-    # at various times used pygame and mingus for midi
-    stop_midi()
-    fluidsynth.stop_everything()
+def shutdown():
+    """Reports, recordings, and all the sound off"""
+    if recorder:
+        recorder.close()
 
-    sys.exit(0)
+    if ARP:
+        arp_clock_report()
+
+    if event_log and args.event_dump:
+        event_log.dump(args.event_dump)
+
+    if latency:
+        latency.report()
+
+    # at various times used pygame and mingus for midi... if we got that far
+    if synth is not None:
+        voice_report()
+        stop_midi()
+        all_voices_off()
 
 def init_midi(instrument_int, instrument_str):
     global midi_player
 
     logging.debug(f"initializing midi, setting instrument to {instrument_str}")
 
+    load_synth_modules()
+
     # initialize & set instrument
     pygame.midi.init()
 
@@ -1094,7 +3278,101 @@ def init_midi(instrument_int, instrument_str):
     midi_player.set_instrument(instrument_int)
 
 #
-# monkeypatching mingus fluidsynth
+# the synth backend... straight to the one pyfluidsynth Synth, plain ints all the way
+#
+# note numbers are the same as they were with mingus (C-0 is 0), fluidsynth's are 12 higher
+#
+# every note goes through the voice table on the way, so however many arps and chords pile up
+# there are never more than MAX_VOICES of them sounding
+#
+def playable(note):
+    """On the synth's keyboard? That's 0-127 for fluidsynth, so -12 to 115 for us"""
+    return -12 <= note <= 115
+
+def play_note(note, channel=1, velocity=100):
+    # shifted off the end of the keyboard (by the octave control, the key...) fluidsynth would
+    # just turn it down, and it'd sit in the voice table for nothing
+    if not playable(note):
+        return
+
+    key = (channel, note)
+
+    if key in voices:
+        # already sounding... the old one's cut rather than stacking another synth voice on top
+        # that we'd lose track of
+        synth.noteoff(channel, note + 12)
+        voice_counts['stopped'] += 1
+        voices.move_to_end(key)
+
+    elif len(voices) >= MAX_VOICES:
+        steal_voice(note)
+
+    voices[key] = velocity
+    voice_counts['started'] += 1
+    voice_counts['peak']     = max(voice_counts['peak'], len(voices))
+
+    synth.noteon(channel, note + 12, velocity)
+
+def stop_note(note, channel=1):
+    # nothing to do if it got stolen already
+    if voices.pop((channel, note), None) is not None:
+        voice_counts['stopped'] += 1
+        synth.noteoff(channel, note + 12)
+
+# a note on every channel of a layered preset
+def play_layers(note, layers, velocity=100):
+    for channel in layers:
+        play_note(note, channel, velocity)
+
+def stop_layers(note, layers):
+    for channel in layers:
+        stop_note(note, channel)
+
+def steal_voice(note):
+    """Out of voices... make room for note according to STEAL_POLICY"""
+    victim = None
+
+    if STEAL_POLICY == "same-note":
+        victim = next((key for key in voices if key[1] == note), None)
+
+    elif STEAL_POLICY == "quietest":
+        # ties go to the oldest, it's first
+        victim = min(voices, key=voices.get)
+
+    if victim is None:
+        victim = next(iter(voices))
+
+    channel, stolen = victim
+    del voices[victim]
+    voice_counts['stolen'] += 1
+
+    logging.debug("out of voices, stole %s on channel %s for %s", stolen, channel, note)
+    synth.noteoff(channel, stolen + 12)
+
+def voice_stats():
+    """Live voice counts... ours, and the synth's own if the fluidsynth library will tell us"""
+    stats = dict(voice_counts, sounding=len(voices), max=MAX_VOICES)
+
+    if fluid_synth_get_active_voice_count is not None and synth is not None and not isinstance(synth, CountingSynth):
+        stats['synth'] = fluid_synth_get_active_voice_count(synth.synth)
+
+    return stats
+
+def voice_report():
+    stats = voice_stats()
+
+    print(f"Voices: {stats['sounding']} sounding of {stats['max']} (peak {stats['peak']}), "
+          f"{stats['started']} started, {stats['stopped']} stopped, {stats['stolen']} stolen ({STEAL_POLICY})"
+          + (f", {stats['synth']} synth voices active" if 'synth' in stats else ""))
+
+def control_change(channel, control, value):
+    synth.cc(channel, control, value)
+
+def set_instrument(channel, program, bank=0):
+    synth.program_select(channel, synth_sfid, bank, program)
+
+#
+# monkeypatching mingus' pyfluidsynth
 #
 
 # Add the setting method to the existing Synth class
@@ -1118,30 +3396,35 @@ def setting(self, name, value):
 
 
 
-def init_synth(SF2):
+def init_synth(SF2, audio=True, warm=()):
+    """
+    Fire up the synth and load the sound font... audio=False leaves out the audio driver, for rendering.
+    warm is [(channel, bank, program, name)] to select and warm up before the audio starts, see warm_up()
+    """
+    global synth, synth_sfid
+
     logging.info(f"initializing fluidsynth")
 
+    load_synth_modules()
+
     # squelch some of those damn errors
     try:
         # dup and close the original
         copy_of_stderr = os.dup(2)
         os.close(2)
 
-        # use fluidsynth for sounds, that troublesome child
-        fluidsynth.init(SF2)
-
         #
         # Monkey patch the method onto the existing class
         #
         pyfluid.Synth.setting = setting
 
-        # the soft underbelly o' the synth
+        # the soft underbelly o' the synth... and the only one, it plays all the notes
         fs = pyfluid.Synth()
 
         # settings are from GeneralUser-GS/documentation/README.html in the SF2 package
 
         # secret settings... sssssecrets.... filthy secretz.....
-        fs.setting('synth.polyphony', 512)
+        fs.setting('synth.polyphony', MAX_VOICES * VOICES_PER_NOTE)
         fs.setting('synth.device-id', 16)
         fs.setting('synth.gain', 0.5)
         fs.setting('synth.reverb.damp', 0.3)
@@ -1153,8 +3436,20 @@ def init_synth(SF2):
         fs.setting('synth.chorus.nr', 4)
         fs.setting('synth.chorus.speed', 0.36)
 
-        fs.start()
+        sfid = fs.sfload(SF2)
+        if sfid == -1:
+            raise Exception(f"couldn't load sound font {SF2}")
+
+        fs.program_reset()
+
+        synth      = fs
+        synth_sfid = sfid
 
+        warm_up(warm)
+
+        # use fluidsynth for sounds, that troublesome child
+        if audio:
+            fs.start()
 
     except Exception as e:
         print(e)
@@ -1167,17 +3462,43 @@ def init_synth(SF2):
         os.close(copy_of_stderr)
         pass
 
+def warm_up(warm):
+    """
+    Select each program on its channel and play a few quiet notes of it into nowhere (the audio
+    driver isn't running yet), so nothing's left to load or page in when it's first played for real
+    """
+    buf = ctypes.create_string_buffer(RENDER_BLOCK * 4)
+
+    for channel, bank, program, name in warm:
+        logging.debug(f"warming up {name} on channel {channel}")
+        set_instrument(channel, program, bank)
+
+        # straight to the synth, these don't count against the voice budget
+        for key in WARM_KEYS:
+            synth.noteon(channel, key, 1)
+        pyfluid.fluid_synth_write_s16(synth.synth, RENDER_BLOCK, buf, 0, 2, buf, 1, 2)
+
+        # all sound off
+        synth.cc(channel, 120, 0)
+
+    if warm:
+        pyfluid.fluid_synth_write_s16(synth.synth, RENDER_BLOCK, buf, 0, 2, buf, 1, 2)
+
 def stop_midi():
     global midi_player
 
     logging.info("shutting down midi...")
 
     del midi_player
-    pygame.midi.quit()
+
+    if pygame is not None:
+        pygame.midi.quit()
 
 def harmonize(chord):
     print("trying to harmonize....")
 
+    load_music21()
+
     major_major = scale.MajorScale(chord)
     harm = harmony.ChordSymbol(chord)
 
@@ -1239,6 +3560,8 @@ def parse_args():
     parser.add_argument('-b', '--arp-bpm',         type=float, default=120, help='Beats per minute for arpeggiation (default: 120)')
     parser.add_argument('-c', '--chords',          action='store_true', default=True, help='Play chords')
     parser.add_argument('-r', '--arp-rate',        type=str, default="1/4", help='Rate of notes per beat as a fraction (e.g., "1/4", "1/8"). Default is 1/4.')
+    parser.add_argument('--arp-phase',             type=str, default="0", metavar='FRACTION', help='How far into its first step a new arp waits before playing, as a fraction of a step (default: 0, right away)')
+    parser.add_argument('--arp-sync',              action='store_true', help='New arps wait for the next step on a beat grid shared with the arps already going, rather than starting right away')
     parser.add_argument('-d', '--arp-direction',   choices=['up', 'down', 'random'], default='up', help='Direction of arpeggiation (default: up)')
     parser.add_argument('--arp-overlay',           action='store_true', help='Continue playing arpeggio after key release, allowing multiple arps to overlap')
     parser.add_argument('--arp-latch',             action='store_true', help='Stop previous arp sounds when starting a new sequence')
@@ -1249,12 +3572,36 @@ def parse_args():
     # General options
     parser.add_argument('-f', '--sound-font-file', type=str, default="", help="alternate SF2 file")
     parser.add_argument('-i', '--instrument',      type=str, default="0", help='Instrument number or name to use; defaults to 0, which is usually the piano')
+    parser.add_argument('--input',                 type=str, action='append', metavar='PATTERN[@INSTRUMENT]', help=f'Midi input(s) to listen to, by name prefix, each on its own channel with its own instrument (default: "{NMSVE}" with -i\'s instrument); repeat for more')
+    parser.add_argument('--presets',               type=str, default='', metavar='SLOTS', help='Programs to have ready on their own channels, switched with program change or --preset-pad, + layers them (e.g., "0,42+48,89")')
+    parser.add_argument('--preset-pad',            type=int, metavar='NOTE', help='Hold this pad (midi note) and hit another to switch presets, the pad n up from it picks preset n-1')
     parser.add_argument('-k', '--key',             type=str, default='C', help='Key to play in (e.g., "C", "F#", "Bb"). Default is C')
     parser.add_argument('-l', '--log-level',       type=str, default="info", choices=["10", "20", "30", "40", "errors-only", "info", "verbose", "debug"], help='Logging level (10/errors-only, 20/info, 30/verbose, 40/debug)')
     parser.add_argument('-s', '--scale',           type=str, help='Scale to use (e.g., "C-D-E-F-G-A-B" or predefined scale name)')
     
     # New option for scale-restricted mode
     parser.add_argument('--only-scale-permitted',  action='store_true', help='Only allow notes that are in the specified scale')
+
+    # Knobs and sliders
+    parser.add_argument('--cc-map',                type=str, default='7=gain', metavar='CONTROL=HANDLER,...', help=f'What each control change number does, handlers are {", ".join(CC_HANDLERS)} (default: 7=gain)')
+
+    # Voice budget
+    parser.add_argument('--max-voices',            type=int, default=MAX_VOICES, metavar='N', help=f'Most notes sounding at once, past that one gets stolen (default: {MAX_VOICES})')
+    parser.add_argument('--steal',                 choices=STEAL_POLICIES, default=STEAL_POLICY, help=f'Which note to steal when out of voices (default: {STEAL_POLICY})')
+
+    # Startup options
+    parser.add_argument('--list-instruments',      action='store_true', help='List the instruments that can be used with -i and exit')
+    parser.add_argument('--event-dump',            type=float, default=0, metavar='SECONDS', help='On exit (or SIGUSR1), print the note events from the last SECONDS seconds')
+    parser.add_argument('--bench',                 nargs='?', const='', metavar='MIDI_FILE', help='Benchmark the message handling with a stub synth (synthetic input, or from a MIDI file) and exit')
+    parser.add_argument('--render',                nargs=2, metavar=('IN_MID', 'OUT_WAV'), help='Render a MIDI file through the key/scale/chord/arp handling to a WAV file, faster than realtime, and exit')
+    parser.add_argument('--record',                type=str, metavar='FILE', help='Record everything that comes in from the NMVSE to a new binary session file (won\'t overwrite one)')
+    parser.add_argument('--replay',                type=str, metavar='FILE', help='Play a recorded session file instead of listening to the NMVSE')
+    parser.add_argument('--replay-speed',          type=float, default=1.0, metavar='N', help='Replay N times faster than it was recorded, 0 is as fast as possible (default: 1)')
+    parser.add_argument('--latency-report',        action='store_true', help='Measure input to sound latency and print percentiles on exit')
+    parser.add_argument('--startup-report',        action='store_true', help='Print how long each phase of startup took once ready to play')
+    parser.add_argument('--profile',               type=str, metavar='PREFIX', help='Sample what every thread is doing the whole time, and on exit write PREFIX.collapsed (flamegraph stacks) and PREFIX.txt (time per function); note it makes threads switch more often while it runs')
+    parser.add_argument('--metrics-port',          type=int, metavar='PORT', help='Serve counters and gauges (notes, voices, arps, dropped events, memory...) for Prometheus at http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--control-socket',        type=str, metavar='PATH', help='Take JSON settings changes (key, scale, arp_pattern, arp_bpm, mode, instrument...), one per line, on a Unix socket while playing')
     
     args = parser.parse_args()
     
@@ -1270,43 +3617,55 @@ INSTRUMENTS = [
 # and so it begins...
 #
 
-# Check if NMSVE is available... assume any starting with NMSVE is ok....
-# if NMSVE not in mido.get_input_names():
-found = False
-for dev in mido.get_input_names():
-    if dev.startswith(NMSVE):
-        NMSVE = dev
-        found = True
-        break
-if not found:
-    logging.error("can't see the NMSVE machine....")
-    sys.exit(2)
-
-
 # Parse command line arguments
 args = parse_args()
 
 # Setup logging
 setup_logging(args.log_level)
 
+# from here on, however we end up leaving
+if args.profile:
+    profiler = Profiler(args.profile)
+    profiler.start()
+    atexit.register(profiler.stop)
+
+if args.sound_font_file:
+    SF2 = args.sound_font_file
+
+# what can we play?
+if args.list_instruments:
+    list_instruments()
+    sys.exit(0)
+
 # Set arpeggiator options
 ARP             = args.arp
 ARP_BPM         = args.arp_bpm
 ARP_RATE        = parse_fraction(args.arp_rate)
+ARP_PHASE       = parse_fraction(args.arp_phase)
+ARP_SYNC        = args.arp_sync
 ARP_DIRECTION   = args.arp_direction
 ARP_OVERLAY     = args.arp_overlay
 ARP_LATCH       = args.arp_latch
 ARP_PATTERN_N   = args.arp_pattern_n
 ARP_PATTERN     = args.arp_pattern
 
+if not 0 <= ARP_PHASE < 1:
+    logging.error(f"--arp-phase is a fraction of a step, from 0 up to (not including) 1, not {args.arp_phase}")
+    sys.exit(1)
+
 # Set scale restriction option
 ONLY_SCALE_PERMITTED = args.only_scale_permitted
 
+# what the knobs and sliders do
+CC_MAP = parse_cc_map(args.cc_map)
+
+# Voice budget
+MAX_VOICES   = max(1, args.max_voices)
+STEAL_POLICY = args.steal
+
 # Set key transposition
 KEY_OFFSET = calculate_key_offset(args.key)
-
-if args.sound_font_file:
-    SF2 = args.sound_font_file
+KEY_NAME   = args.key
 
 # chords or single notes?
 CHORDS = True
@@ -1324,51 +3683,67 @@ if args.scale:
             logging.warning("Scale restriction requested but no valid scale provided. All notes will be allowed.")
             ONLY_SCALE_PERMITTED = False
 
-# catch interrupts
-signal.signal(signal.SIGINT,  signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+    if current_scale:
+        SCALE_NAME = args.scale
 
-#
-# convert instrument to string or int
-#
-# currently can't lookup names in arbitrary sf2 files
-#
-if not args.instrument.isdigit() and args.sound_font_file:
-    logging.error("Can't look up instrument names in arbitrary SF2 files")
-    sys.exit(44)
+# voice all the chords and compile the arp pattern up front, rather than on every press
+rebuild_derived_tables()
+
+# no device, no audio... just see how fast the message handling goes
+if args.bench is not None:
+    run_bench(args.bench)
+    sys.exit(0)
+
+if args.latency_report:
+    latency = LatencyStats()
+
+# the note path's chatter goes through the event log, if it's going anywhere at all
+if logging.getLogger().isEnabledFor(logging.WARNING) or args.event_dump:
+    event_log = EventLog(echo=logging.getLogger().isEnabledFor(logging.WARNING))
 
-#
-# default SF2 file
-#
-if not args.sound_font_file:
-    # choose/defaults to an integer for an instrument, look up the name
-    if args.instrument.isdigit():
-        instrument_str = INSTRUMENTS[int(args.instrument)]
-        instrument_int = int(args.instrument)
-    # if you tried an instrument on its name, see if we can find it in the default midi set of instruments
-    else:
-        instrument_int = instrument_string_search(args.instrument)
-        instrument_str = args.instrument
 
-    logging.debug("Default SF2, instrument %s/%s" % (instrument_str, instrument_int))
 #
-# rando SF2 file
+# what to listen to... each input gets its own synth channel and instrument (an instrument
+# number or name from the default set, numbers only for a rando SF2 file)
 #
-else:
-    instrument_int = int(args.instrument)
-    instrument_str = str(instrument_int)
+inputs = [make_input(port, spec) for port, spec in enumerate(args.input or [NMSVE])]
+
+for inp in inputs:
+    logging.debug("input %s -> channel %s, instrument %s/%s" % (inp['pattern'], inp['channel'], inp['instrument_str'], inp['instrument_int']))
+
+# every input's instrument and the presets get selected and warmed up before the audio starts
+warm = [(inp['channel'], inp['bank'], inp['instrument_int'], inp['instrument_str']) for inp in inputs] + setup_presets(args.presets)
+
+PRESET_PAD = args.preset_pad
+
+# no device, no audio... straight from a MIDI file to a WAV, as fast as we can go (as the first input)
+if args.render:
+    init_synth(SF2, audio=False, warm=warm)
+    setup_instrument(inputs[0]['instrument_int'], inputs[0]['instrument_str'], inputs[0]['channel'], inputs[0]['bank'])
+    render_midi(*args.render)
+    sys.exit(0)
+
+# for the inputs... run_live() and its watcher go looking for them, assume any starting with NMSVE is ok....
+load_mido()
+
+# before the SF2 load, so a session that's already there stops us right away
+if args.record:
+    recorder = SessionRecorder(args.record)
 
 #
 # fluidsynth care n feeding
 #
-init_synth(SF2)
+with startup_phase("SF2 load"):
+    init_synth(SF2, warm=warm)
 
-# Setup instrument
-if not setup_instrument(instrument_int, instrument_str):
-    init_midi(0, "Default")
+# Setup instruments
+for inp in inputs:
+    if not setup_instrument(inp['instrument_int'], inp['instrument_str'], inp['channel'], inp['bank']):
+        init_midi(0, "Default")
+        break
 else:
     # start midi engines
-    init_midi(instrument_int, instrument_str)
+    init_midi(inputs[0]['instrument_int'], inputs[0]['instrument_str'])
 
 # what's there?
 get_midi_out_devices()
@@ -1378,80 +3753,10 @@ if ARP:
     logging.info(f"Overlay={ARP_OVERLAY}, Latch={ARP_LATCH}")
     logging.info(f"Pattern: {ARP_PATTERN}")
     logging.info("ready to arp!")
-    
-    # Start the arpeggiator
-    start_arpeggiator()
 else:
     logging.info("no mas arpy")
 
-logging.warning("galloping along with our polling... time to start interacting with NMVSE!")
-logging.info("Listening for input from %s" % NMSVE)
-
-current_value = 0
-last_control_change = 0
-fluidsynth_gain = environ["FLUIDSYNTH_GAIN"]
-
 #
-# keep listening until ... 
+# keep listening until ... told to stop (or the replay's over)
 #
-with mido.open_input(NMSVE) as incoming:
-    for msg in incoming:
-        # notes, chords, whatever
-        if msg.type == "note_on":
-
-            msg.note = msg.note - 12
-            # print("MidiNote: %s" % msg.note)
-
-            note_str, octave = number_to_note(msg.note)
-
-            if HARMONIZER:
-                logging.info("harmonizer....")
-                logging.info("%s-%s" % (note_str, octave))
-                harmonize(note_str)
-            else:
-                start_sound(msg.channel, msg.note)
-
-        elif msg.type == "note_off":
-            msg.note = msg.note - 12
-            stop_sound(msg.channel, msg.note)
-
-        elif msg.type == "polytouch":
-            print(msg)
-
-        #
-        # use the NMSME rotator to change volume
-        #
-        elif msg.type == "control_change":
-            current_value = msg.value
-
-            # because... my noise midi is a bit... noisy... only do somethin if it' moves more than... a X or more
-            if not current_value:
-                current_value = int(msg.value)
-                last_control_change = current_value
-                continue
-
-            if abs(current_value - last_control_change) > KNOB_TOLERANCE:
-                GAIN = current_value / 127 * 100
-                logging.debug(f"Changing gain to: {GAIN}")
-                # Set the gain
-                # channel, gain, value (0-100?)
-                fluidsynth.control_change(1, 7, int(GAIN))
-                last_control_change = current_value
-
-        elif msg.type == "program_change":
-            print(msg)
-
-        elif msg.type == "aftertouch":
-            print(msg)
-
-        elif msg.type == "pitchwheel":
-            print(msg)
-
-        else:
-            logging.warning("not sure how to handle message type - %s" % msg.type)
-            continue
-
-
-# probably won't get to this, given the loop above and so on....
-stop_midi()
-
+asyncio.run(run_live())